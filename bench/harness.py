@@ -0,0 +1,107 @@
+#!/usr/local/bin python3.11
+
+# **** PlayCode benchmark harness ****
+
+# python3 bench/harness.py [--engines=closure,vm,c] [--only=name,...] [--scale=F]
+#                          [--warmup=N] [--runs=N] [--out=<file>] [--baseline=<file>] [--tolerance=F]
+# times every benchmark program end to end under pc.py engines and the pcc.py C
+# path, reports median and p95 wall time and fails on regressions against a baseline
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from programs import BENCHMARKS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLORS = {
+    'cyan': '\033[96m',
+    'green': '\033[92m',
+    'warning': '\033[93m',
+    'fail': '\033[91m',
+    'end': '\033[0m',
+}
+
+def command(engine, path):
+    if engine == "c":
+        return [sys.executable, os.path.join(ROOT, "pcc.py"), path]
+    return [sys.executable, os.path.join(ROOT, "pc.py"), path, f"--engine={engine}"]
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))]
+
+def measure(engine, source, expected, warmup, runs):
+    # the program is written to a directory of its own, removed afterwards
+    with tempfile.TemporaryDirectory(prefix="playcode-bench-") as workdir:
+        path = os.path.join(workdir, "bench.pc")
+        with open(path, "w") as f: f.write(source)
+        times = []
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            result = subprocess.run(command(engine, path), cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            elapsed = time.perf_counter() - start
+            output = result.stdout.split()
+            if result.returncode != 0 or output[-len(expected):] != expected:
+                return dict(status="error", error=(result.stderr.strip().splitlines() or [f"output {output[-len(expected):]}, expected {expected}"])[-1])
+            if i >= warmup: times.append(elapsed)
+    return dict(status="ok", median=statistics.median(times), p95=percentile(times, 95), runs=times)
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None or previous["status"] != "ok":
+            continue
+        if result["status"] != "ok":
+            regressions.append(f"{name} worked in the baseline and now fails: {result['error']}")
+        elif result["median"] > previous["median"] * (1 + tolerance):
+            regressions.append(f"{name} median {result['median']:.3f} s vs baseline {previous['median']:.3f} s")
+    return regressions
+
+if (__name__ == "__main__"):
+    option = lambda name, default: next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith(f"--{name}=")), default)
+    engines = option("engines", "closure,vm,c").split(",")
+    only = option("only", ",".join(BENCHMARKS)).split(",")
+    scale = float(option("scale", 1))
+    warmup, runs = int(option("warmup", 1)), int(option("runs", 5))
+    tolerance = float(option("tolerance", 0.10))
+    baseline = {}
+    if option("baseline", None):
+        with open(option("baseline", None), "r") as f: baseline = json.load(f)
+
+    results = {}
+    print(f"{COLORS['cyan']}{'benchmark':<18} {'size':>7}  {'engine':<8} {'median':>9} {'p95':>9}  baseline{COLORS['end']}")
+    for name in only:
+        generate, size = BENCHMARKS[name]
+        size = max(1, int(size * scale))
+        source, expected = generate(size)
+        for engine in engines:
+            key = f"{name}/{engine}"
+            results[key] = dict(size=size, **measure(engine, source, expected, warmup, runs))
+            result = results[key]
+            if result["status"] != "ok":
+                print(f"  {name:<16} {size:>7}  {engine:<8} {COLORS['fail']}error: {result['error']}{COLORS['end']}")
+                continue
+            previous = baseline.get("results", {}).get(key)
+            delta = ""
+            if previous and previous["status"] == "ok":
+                change = result["median"] / previous["median"] - 1
+                color = COLORS['fail'] if change > tolerance else COLORS['green'] if change < -tolerance else ""
+                delta = f"{color}{change:+.1%}{COLORS['end'] if color else ''}"
+            print(f"  {name:<16} {size:>7}  {engine:<8} {result['median']:8.3f}s {result['p95']:8.3f}s  {delta}")
+
+    if option("out", None):
+        with open(option("out", None), "w") as f:
+            json.dump(dict(python=platform.python_version(), platform=platform.platform(), scale=scale,
+                           warmup=warmup, runs=runs, results=results), f, indent=2, sort_keys=True)
+    regressions = compare(results, baseline, tolerance)
+    for regression in regressions:
+        print(f"{COLORS['fail']}Regression: {regression}{COLORS['end']}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,119 @@
+# **** PlayCode benchmark programs ****
+
+# each generator takes a size and returns (source, expected output lines), the
+# output check keeps every engine and the C path honest while being timed
+
+import random
+
+def bubblesort(n):
+    random.seed(n)
+    data = [random.randint(0, 1000) for _ in range(n)]
+    source = f"""-- bubble sort over {n} elements
+x = [{", ".join(map(str, data))}]
+n = {n}
+i = 0
+@init_j j = 0
+while i < (n - 1) {{
+    @init_j
+    while j < (n - 1) {{
+        if x[j] > x[j + 1] {{
+            swap x[j] x[j + 1]
+        }}
+        j = j + 1
+    }}
+    i = i + 1
+}}
+print x[0]
+print x[n - 1]
+"""
+    return source, [str(min(data)), str(max(data))]
+
+def nested_loops(n):
+    source = f"""-- nested while loops, {n} x {n} iterations
+total = 0
+i = 0
+while i < {n} {{
+    j = 0
+    while j < {n} {{
+        total = total + i * j - j
+        j = j + 1
+    }}
+    i = i + 1
+}}
+print total
+"""
+    return source, [str(sum(i * j - j for i in range(n) for j in range(n)))]
+
+def tags(n):
+    source = f"""-- tag calls in a hot loop, {n} iterations
+count = 0
+acc = 0
+@inc count = count + 1
+@add acc = acc + count
+while count < {n} {{
+    @inc
+    @add
+}}
+print acc
+"""
+    return source, [str(n * (n + 1) // 2)]
+
+# parenthesised expression nested `n` levels deep, evaluated in a loop
+def deep_expression(n, repeat=2000):
+    expr = "i"
+    for k in range(1, n + 1):
+        op = ["+", "-", "*"][k % 3]
+        expr = f"({expr} {op} {1 if op == '*' else k})"
+    value = lambda i: eval(expr.replace("i", str(i)))
+    source = f"""-- expression nested {n} levels deep
+i = 0
+total = 0
+while i < {repeat} {{
+    total = total + {expr}
+    i = i + 1
+}}
+print total
+"""
+    return source, [str(sum(value(i) for i in range(repeat)))]
+
+# vector literal of `n` elements rebuilt on every iteration
+def vector_literal(n, repeat=50):
+    source = f"""-- vector literal of {n} elements
+i = 0
+total = 0
+while i < {repeat} {{
+    x = [{", ".join(str(k) for k in range(n))}]
+    total = total + x[{n - 1}] + x[i]
+    i = i + 1
+}}
+print total
+"""
+    return source, [str(repeat * (n - 1) + sum(range(repeat)))]
+
+# one expression of `n` terms on variables (so nothing folds), nested right to
+# left by the grammar as deep as it is long, engines run it as a postfix node
+def long_expression(n):
+    terms = [["x", "y", "x * y", str(k % 7)][k % 4] for k in range(n)]
+    values = [{"x": 3, "y": 5, "x * y": 15}.get(term) or int(term) for term in terms]
+    ops = ["+" if k % 3 else "-" for k in range(n - 1)]
+    # a - b + c is a - (b + c) here
+    total = values[-1]
+    for k in range(n - 2, -1, -1):
+        total = values[k] + total if ops[k] == "+" else values[k] - total
+    source = f"""-- expression of {n} terms
+x = 3
+y = 5
+total = {terms[0]}{"".join(f" {op} {term}" for op, term in zip(ops, terms[1:]))}
+print total
+"""
+    return source, [str(total)]
+
+# name -> (generator, default size)
+BENCHMARKS = {
+    "bubblesort": (bubblesort, 200),
+    "nested_loops": (nested_loops, 200),
+    "tags": (tags, 20000),
+    "deep_expression": (deep_expression, 60),
+    "vector_literal": (vector_literal, 2000),
+    "long_expression": (long_expression, 100000),
+}
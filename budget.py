@@ -0,0 +1,42 @@
+# **** PlayCode execution budget ****
+
+# --max-steps and --timeout: every engine counts a step at each loop back edge
+# and tag call, `left` counts down to the next full check, so a tight loop pays
+# a decrement and a compare per iteration and the clock is read once every
+# EVERY steps, running out raises OutOfBudget (the tables keep what ran)
+
+import time
+
+EVERY = 4096
+
+class OutOfBudget(Exception):
+    pass
+
+class Budget:
+    def __init__(self, steps=None, seconds=None):
+        self.steps = steps
+        self.seconds = seconds
+        self.start = time.perf_counter()
+        self.used = 0
+        self.size = EVERY if steps is None else min(EVERY, steps)
+        self.left = self.size
+
+    # called once `left` is below 0, size + 1 steps after the last check, returns
+    # the new `left` for engines counting down a local copy of it
+    def refill(self):
+        self.used += self.size + 1
+        if self.steps is not None and self.used > self.steps:
+            raise OutOfBudget(f"step budget of {self.steps} used up")
+        if self.seconds is not None and time.perf_counter() - self.start > self.seconds:
+            raise OutOfBudget(f"time limit of {self.seconds} s reached after {self.used} steps")
+        self.size = EVERY if self.steps is None else min(EVERY, self.steps - self.used)
+        self.left = self.size
+        return self.left
+
+    # `call` counting a step each time
+    def counted(self, call):
+        def run():
+            self.left -= 1
+            if self.left < 0: self.refill()
+            return call()
+        return run
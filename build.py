@@ -0,0 +1,20 @@
+#!/usr/local/bin python3.11
+
+# **** PlayCode build ****
+
+# python3 build.py, generates the standalone parser pc_parser.py from pc.lark so
+# parsing needs neither lark at runtime nor grammar analysis at startup
+
+import os
+import subprocess
+import sys
+
+import frontend
+
+if (__name__ == "__main__"):
+    out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pc_parser.py")
+    source = subprocess.run([sys.executable, "-m", "lark.tools.standalone", frontend.GRAMMAR, "-s", "program", "--propagate_positions", "-c"],
+                            stdout=subprocess.PIPE, check=True, text=True).stdout
+    # front end only uses the standalone parser while it matches pc.lark
+    with open(out, "w") as f: f.write(source + f"\nGRAMMAR_HASH = {frontend.grammar_hash()!r}\n")
+    print(f"{out} generated")
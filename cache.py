@@ -0,0 +1,79 @@
+# **** PlayCode on-disk cache ****
+
+# keeps parsed (or compiled) programs between runs, keyed by content hash so
+# edits to the grammar, source or interpreter invalidate entries on their own,
+# least recently used entries are evicted past CACHE_SIZE
+
+# entries are marshal data, which costs nothing to import on the startup path
+import hashlib
+import marshal
+import os
+
+CACHE_DIR = os.environ.get("PLAYCODE_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "playcode")
+CACHE_SIZE = int(os.environ.get("PLAYCODE_CACHE_SIZE", 64 * 1024 * 1024))
+
+ENABLED = True
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_sources = {}
+
+def key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(b"\0" + (part if isinstance(part, bytes) else str(part).encode()))
+    return digest.hexdigest()
+
+# hash of the files (next to this one) an entry is made by, as part of its key,
+# so what older code made is never loaded, each file is read once per run
+def sources(*names):
+    digest = hashlib.sha256()
+    for name in names:
+        if name not in _sources:
+            try:
+                with open(os.path.join(HERE, name), "rb") as f: _sources[name] = hashlib.sha256(f.read()).digest()
+            except OSError:
+                _sources[name] = b""
+        digest.update(_sources[name])
+    return digest.hexdigest()
+
+def load(name):
+    if not ENABLED: return None
+    path = os.path.join(CACHE_DIR, name)
+    try:
+        with open(path, "rb") as f: value = marshal.loads(f.read())
+        # mtime doubles as last use for eviction
+        os.utime(path)
+        return value
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+def store(name, value):
+    if not ENABLED: return
+    import tempfile
+    try:
+        data = marshal.dumps(value)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # write then rename, so concurrent runs never see half an entry
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f: f.write(data)
+        os.replace(tmp, os.path.join(CACHE_DIR, name))
+    except (OSError, ValueError):
+        return
+    evict()
+
+def evict():
+    entries = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.is_file() and not entry.name.startswith(".tmp-"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for (mtime, size, path) in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= CACHE_SIZE: break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
@@ -0,0 +1,365 @@
+# **** PlayCode closure compiler ****
+
+# compiles the lowered tree (see syntax.lower) once into nested python closures,
+# so running a program no longer dispatches on tree.data
+
+import resolve
+import syntax
+import vectors
+
+# with a budget.Budget, loop back edges and tag calls count steps of it
+def compile_program(tree, SYMBOL_TABLE, TAG_TABLE, STDOUT, STDERR, budget=None):
+    # expressions too deep to compile by recursion become postfix nodes
+    tree = syntax.flatten(tree)
+    # variables live in numbered slots of one preallocated frame, None while unset
+    slots = resolve.resolve(tree)
+    unset = resolve.unset(tree)
+    frame = [None] * len(slots)
+
+    # a statement that first reads the variables of `sides` (identifier nodes),
+    # checked if they may be unset
+    def guard(run, *sides):
+        checks = tuple((slots[str(side.children[0])], str(side.children[0])) for side in sides if id(side) in unset)
+        if not checks:
+            return run
+        def guarded():
+            for slot, name in checks:
+                if frame[slot] is None: raise KeyError(name)
+            run()
+        return guarded
+
+    def block(children):
+        stmts = tuple(compile_node(branch) for branch in children)
+        if len(stmts) == 0:
+            return lambda: None
+        if len(stmts) == 1:
+            return stmts[0]
+        def run():
+            for stmt in stmts: stmt()
+        return run
+
+    def compile_node(tree):
+        match tree.data:
+            case "program":
+                return block(tree.children)
+            case "taggable":
+                if len(tree.children) > 1:
+                    tag, body = tree.children[0].value, compile_node(tree.children[1])
+                    def run():
+                        TAG_TABLE[tag] = body
+                    return run
+                return compile_node(tree.children[0])
+            case "assign_stmt":
+                left, right = tree.children
+                slot, value = slots[str(left.children[0])], compile_node(right)
+                if len(left.children) > 1:
+                    index = compile_node(left.children[1])
+                    # only ints go straight into a typed vector, anything else may widen it to a list
+                    def run():
+                        item, vector, i = value(), frame[slot], index()
+                        if type(item) is int or type(vector) is list:
+                            try:
+                                vector[i] = item
+                                return
+                            except OverflowError:
+                                pass
+                        vectors.store(vector, i, item, (frame,))
+                    return guard(run, left)
+                def run():
+                    frame[slot] = value()
+                return run
+            case "tag_stmt":
+                tag = tree.children[0].value
+                if budget is not None:
+                    def run():
+                        budget.left -= 1
+                        if budget.left < 0: budget.refill()
+                        TAG_TABLE[tag]()
+                    return run
+                return lambda: TAG_TABLE[tag]()
+            case "swap_stmt":
+                left, right = tree.children
+                a, b = slots[str(left.children[0])], slots[str(right.children[0])]
+                # as in the walker, the right index is evaluated again after the left side is stored
+                if len(left.children) > 1 and len(right.children) > 1:
+                    i, j = compile_node(left.children[1]), compile_node(right.children[1])
+                    def run():
+                        x, ii = frame[a], i()
+                        u, v = frame[b][j()], x[ii]
+                        if type(u) is int or type(x) is list:
+                            try:
+                                x[ii] = u
+                            except OverflowError:
+                                vectors.store(x, ii, u, (frame,))
+                        else:
+                            vectors.store(x, ii, u, (frame,))
+                        y, jj = frame[b], j()
+                        if type(v) is int or type(y) is list:
+                            try:
+                                y[jj] = v
+                                return
+                            except OverflowError:
+                                pass
+                        vectors.store(y, jj, v, (frame,))
+                elif len(left.children) > 1:
+                    i = compile_node(left.children[1])
+                    def run():
+                        x, ii = frame[a], i()
+                        u, frame[b] = frame[b], x[ii]
+                        vectors.store(x, ii, u, (frame,))
+                elif len(right.children) > 1:
+                    j = compile_node(right.children[1])
+                    def run():
+                        u = frame[a]
+                        frame[a] = frame[b][j()]
+                        vectors.store(frame[b], j(), u, (frame,))
+                else:
+                    def run():
+                        frame[a], frame[b] = frame[b], frame[a]
+                return guard(run, left, right)
+            case "if_stmt":
+                cond = compile_node(tree.children[0])
+                then = compile_node(tree.children[1]) if len(tree.children) > 1 else None
+                if len(tree.children) > 2:
+                    otherwise = compile_node(tree.children[2])
+                    def run():
+                        if cond(): then()
+                        else: otherwise()
+                    return run
+                def run():
+                    if cond(): then()
+                return run
+            case "while_stmt":
+                cond = compile_node(tree.children[0])
+                body = compile_node(tree.children[1]) if len(tree.children) > 1 else lambda: None
+                if budget is not None:
+                    def run():
+                        while cond():
+                            body()
+                            budget.left -= 1
+                            if budget.left < 0: budget.refill()
+                    return run
+                def run():
+                    while cond(): body()
+                return run
+            case "assert_stmt":
+                value, expected = compile_node(tree.children[0]), tree.children[1].children[0]
+                def run():
+                    output = str(value())
+                    if not output == expected:
+                        STDERR.append(f"Assert error: {output} not equal to {expected}")
+                return run
+            case "print_stmt":
+                value = compile_node(tree.children[0])
+                if len(tree.children) > 1 and tree.children[1].data == "assert":
+                    expected = tree.children[1].children[0]
+                    def run():
+                        output = str(value())
+                        if not output == expected:
+                            STDERR.append(f"Assert error: {output} not equal to {expected}")
+                        STDOUT.append(output)
+                    return run
+                def run():
+                    STDOUT.append(str(value()))
+                return run
+            case "add" | "sub" | "mul" | "div" | "eq" | "neq" | "lt" | "gt":
+                return binary(tree.data, *tree.children)
+            case "vector":
+                items = tuple(compile_node(branch) for branch in tree.children)
+                return lambda: vectors.vector([item() for item in items])
+            case "reduction":
+                name, value = str(tree.children[0]), compile_node(tree.children[1])
+                return lambda: vectors.reduce(name, value())
+            case "number":
+                # an int since lowering, unless int() rejects the literal (1.5), which fails when it runs
+                value = tree.children[0]
+                if type(value) is not int:
+                    return lambda: int(value)
+                return lambda: value
+            case "identifier":
+                name = str(tree.children[0])
+                slot = slots[name]
+                if id(tree) in unset:
+                    if len(tree.children) > 1:
+                        index = compile_node(tree.children[1])
+                        def run():
+                            vector = frame[slot]
+                            if vector is None: raise KeyError(name)
+                            return vector[int(index())]
+                        return run
+                    def run():
+                        value = frame[slot]
+                        if value is None: raise KeyError(name)
+                        return value
+                    return run
+                if len(tree.children) > 1:
+                    index = compile_node(tree.children[1])
+                    return lambda: frame[slot][int(index())]
+                return lambda: frame[slot]
+            case "true":
+                return lambda: True
+            case "false":
+                return lambda: False
+            case "postfix":
+                return postfix(tree.children)
+            case "linear":
+                return linear(tree.children)
+        raise SyntaxError(f"Unknown node: {tree.data}")
+
+    # binary operators specialise on a constant right operand (i < 10, j + 1, ...),
+    # arithmetic on a vector operand fails in int() and goes elementwise
+    def binary(op, left, right):
+        l = compile_node(left)
+        k = constant(right)
+        if k is not None:
+            match op:
+                case "add":
+                    def run():
+                        a = l()
+                        try: return int(a) + k
+                        except TypeError: return vectors.binary(op, a, k)
+                    return run
+                case "sub":
+                    def run():
+                        a = l()
+                        try: return int(a) - k
+                        except TypeError: return vectors.binary(op, a, k)
+                    return run
+                case "mul":
+                    def run():
+                        a = l()
+                        try: return int(a) * k
+                        except TypeError: return vectors.binary(op, a, k)
+                    return run
+                case "div":
+                    def run():
+                        a = l()
+                        try: return int(a) / k
+                        except TypeError: return vectors.binary(op, a, k)
+                    return run
+                case "eq": return lambda: int(l()) == k
+                case "neq": return lambda: int(l()) != k
+                case "lt": return lambda: int(l()) < k
+                case "gt": return lambda: int(l()) > k
+        r = compile_node(right)
+        match op:
+            case "add":
+                def run():
+                    a, b = l(), r()
+                    try: return int(a) + int(b)
+                    except TypeError: return vectors.binary(op, a, b)
+                return run
+            case "sub":
+                def run():
+                    a, b = l(), r()
+                    try: return int(a) - int(b)
+                    except TypeError: return vectors.binary(op, a, b)
+                return run
+            case "mul":
+                def run():
+                    a, b = l(), r()
+                    try: return int(a) * int(b)
+                    except TypeError: return vectors.binary(op, a, b)
+                return run
+            case "div":
+                def run():
+                    a, b = l(), r()
+                    try: return int(a) / int(b)
+                    except TypeError: return vectors.binary(op, a, b)
+                return run
+            case "eq": return lambda: int(l()) == int(r())
+            case "neq": return lambda: int(l()) != int(r())
+            case "lt": return lambda: int(l()) < int(r())
+            case "gt": return lambda: int(l()) > int(r())
+
+    # a flattened expression runs its steps on a stack of values, each leaf a compiled closure
+    def postfix(steps):
+        ops = []
+        for step in steps:
+            match step.data:
+                case "element":
+                    name = str(step.children[0])
+                    ops.append(("checked" if id(step) in unset else "element", (slots[name], name)))
+                case "reduction":
+                    ops.append(("reduction", str(step.children[0])))
+                case "add" | "sub" | "mul" | "div" | "eq" | "neq" | "lt" | "gt" | "int":
+                    ops.append((step.data, None))
+                case _:
+                    ops.append((None, compile_node(step)))
+        def run():
+            values = []
+            push, pop = values.append, values.pop
+            for op, argument in ops:
+                if op is None:
+                    push(argument())
+                    continue
+                match op:
+                    case "add" | "sub" | "mul" | "div":
+                        b = pop()
+                        a = values[-1]
+                        try:
+                            match op:
+                                case "add": values[-1] = int(a) + int(b)
+                                case "sub": values[-1] = int(a) - int(b)
+                                case "mul": values[-1] = int(a) * int(b)
+                                case "div": values[-1] = int(a) / int(b)
+                        except TypeError:
+                            values[-1] = vectors.binary(op, a, b)
+                    # the left operand already went through int
+                    case "eq": b = pop(); values[-1] = values[-1] == int(b)
+                    case "neq": b = pop(); values[-1] = values[-1] != int(b)
+                    case "lt": b = pop(); values[-1] = values[-1] < int(b)
+                    case "gt": b = pop(); values[-1] = values[-1] > int(b)
+                    case "int": values[-1] = int(values[-1])
+                    case "element": values[-1] = frame[argument[0]][int(values[-1])]
+                    case "checked":
+                        vector = frame[argument[0]]
+                        if vector is None: raise KeyError(argument[1])
+                        values[-1] = vector[int(values[-1])]
+                    case "reduction": values[-1] = vectors.reduce(argument, values[-1])
+            return values[0]
+        return run
+
+    # blocks taken apart by syntax.flatten, as (condition, target) for a branch,
+    # (None, target) for a jump and (statement, None) otherwise, run with a step counter
+    def linear(steps):
+        ops = []
+        for step in steps:
+            match step.data:
+                case "branch": ops.append((compile_node(step.children[0]), step.children[1]))
+                case "jump": ops.append((None, step.children[0]))
+                case _: ops.append((compile_node(step), None))
+        end = len(ops)
+        def run():
+            pc = 0
+            while pc < end:
+                op, target = ops[pc]
+                if target is None:
+                    op()
+                    pc += 1
+                elif op is not None:
+                    pc = pc + 1 if op() else target
+                else:
+                    # a jump back is a loop back edge
+                    if budget is not None and target <= pc:
+                        budget.left -= 1
+                        if budget.left < 0: budget.refill()
+                    pc = target
+        return run
+
+    # integer value of a literal operand, else None
+    def constant(tree):
+        match tree.data:
+            case "number": return tree.children[0] if type(tree.children[0]) is int else None
+            case "true": return 1
+            case "false": return 0
+        return None
+
+    program = compile_node(tree)
+    # the tables get what ran even when the program stops on an error
+    def run():
+        try:
+            program()
+        finally:
+            SYMBOL_TABLE.update(resolve.tables(slots, frame))
+    return run
@@ -0,0 +1,79 @@
+# **** PlayCode front end ****
+
+# parses source into syntax trees through the on-disk cache, a cache hit never
+# imports a parser, a miss uses the generated standalone parser (python3 build.py)
+# when it matches pc.lark and falls back to lark otherwise, or the hand-written
+# parser with PARSER = "handwritten"
+
+import hashlib
+import os
+
+import cache
+import syntax
+
+GRAMMAR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pc.lark")
+
+PARSER = "lark"
+
+# statement positions are kept for the profiler
+OPTIONS = dict(start="program", parser="lalr", propagate_positions=True)
+
+_parser = None
+_grammar = None
+
+def grammar():
+    global _grammar
+    if _grammar is None:
+        with open(GRAMMAR, "r") as f: _grammar = f.read()
+    return _grammar
+
+def grammar_hash():
+    return hashlib.sha256((grammar() + repr(sorted(OPTIONS.items()))).encode()).hexdigest()
+
+def parser():
+    global _parser
+    if _parser is None:
+        try:
+            import pc_parser
+            if pc_parser.GRAMMAR_HASH == grammar_hash():
+                _parser = pc_parser.Lark_StandAlone()
+        except ImportError:
+            pass
+    if _parser is None:
+        from lark import Lark
+        tables = False
+        if cache.ENABLED:
+            try:
+                os.makedirs(cache.CACHE_DIR, exist_ok=True)
+                tables = os.path.join(cache.CACHE_DIR, f"grammar-{cache.key(grammar())}.lark")
+            except OSError:
+                pass
+        _parser = Lark(grammar(), cache=tables, **OPTIONS)
+    return _parser
+
+# the modules a parse tree is made by, cached compiled programs add their own
+SOURCES = ("frontend.py", "syntax.py", "tokenizer.py", "handparser.py")
+
+# the lowered tree (syntax.lower) is what gets cached, so a hit skips lowering too
+def parse(source):
+    name = f"tree-{cache.key(cache.sources(*SOURCES), grammar(), PARSER, source)}"
+    data = cache.load(name)
+    if data is not None:
+        return syntax.decode(data)
+    if PARSER == "handwritten":
+        import handparser
+        tree = syntax.lower(handparser.parse(source))
+    else:
+        tree = syntax.lower(parser().parse(source))
+    cache.store(name, syntax.encode(tree))
+    return tree
+
+# source typed into the REPL: its tree if it is a whole program, None if it stops
+# part way through a statement or block (an open {, a trailing operator), so more
+# lines may finish it, syntax errors raise as in parse, never cached
+def parse_partial(source):
+    interactive = parser().parse_interactive(source)
+    interactive.exhaust_lexer()
+    if "$END" not in interactive.accepts():
+        return None
+    return syntax.lower(interactive.feed_eof())
@@ -0,0 +1,257 @@
+# **** PlayCode hand-written parser ****
+
+# parser for pc.lark over tokenizer.tokenize, builds the same tree shape as lark
+# (rule names, aliases, kept tokens) out of syntax.Tree/Token, operator chains are
+# collected in loops and nested right to left like the grammar, blocks and
+# parentheses are kept on stacks of the ones open instead of parsed by recursion
+# (so they nest any depth), statements get the line and column of their first
+# token like propagate_positions
+
+from syntax import Tree, Statement, Token
+from tokenizer import tokenize, line
+
+COMPARISON = {"==": "eq", "!=": "neq", "<": "lt", ">": "gt"}
+EXPR = {"+": "add", "-": "sub"}
+TERM = {"*": "mul", "/": "div"}
+
+# operator chains by precedence, tightest first
+LEVELS = ((TERM, "term"), (EXPR, "expr"), (COMPARISON, "comparison"))
+
+# keywords lark's contextual lexer reads as names where no keyword can follow
+NAMES = {"CNAME", "swap", "if", "else", "while", "print"}
+
+def parse(source):
+    tokens = tokenize(source)
+    tokens.append(("$END", "", len(source)))
+    current_token_index = 0
+
+    def peek():
+        return tokens[current_token_index][0]
+
+    def advance():
+        nonlocal current_token_index
+        token = tokens[current_token_index]
+        current_token_index += 1
+        return token
+
+    def expect(kind):
+        token = advance()
+        if token[0] != kind:
+            error(token, kind)
+        return token
+
+    # lines are counted on from the previous statement, statements come in source order
+    line_position, line_number, line_start = 0, 1, 0
+
+    def position(token):
+        nonlocal line_position, line_number, line_start
+        line_number += source.count("\n", line_position, token[2])
+        newline = source.rfind("\n", line_position, token[2])
+        if newline >= 0:
+            line_start = newline + 1
+        line_position = token[2]
+        return line_number, token[2] - line_start + 1
+
+    def error(token, expected):
+        raise SyntaxError(f"Unexpected token {token[1]!r} at line {line(source, token[2])}, expected {expected}")
+
+    # program ::= (taggable | tag_stmt | swap_stmt | if_stmt | while_stmt | assert_stmt | print_stmt)*
+    # if_stmt ::= "if" comparison "{" (program)* "}" ("else" "{" (program)* "}")?
+    # while_stmt ::= "while" comparison "{" (program)* "}"
+    # the blocks open are on a stack, each with the kind of its statement, where
+    # it starts, the children it has so far and the statements around it
+    def parse_program():
+        blocks, statements = [], []
+        while True:
+            if peek() == "}" and blocks:
+                advance()
+                kind, line, column, children, outer = blocks.pop()
+                # an empty block has no program node at all
+                if statements: children.append(Tree("program", statements))
+                if kind == "if" and peek() == "else":
+                    advance()
+                    expect("{")
+                    blocks.append(("else", line, column, children, outer))
+                    statements = []
+                    continue
+                statements = outer
+                statements.append(Statement("while_stmt" if kind == "while" else "if_stmt", children, line, column))
+            elif peek() in ("if", "while"):
+                line, column = position(tokens[current_token_index])
+                kind = advance()[0]
+                children = [parse_comparison()]
+                expect("{")
+                blocks.append((kind, line, column, children, statements))
+                statements = []
+            elif peek() == "$END" and not blocks:
+                return statements
+            else:
+                statements.append(parse_statement())
+
+    def parse_statement():
+        line, column = position(tokens[current_token_index])
+        tree = parse_statement_kind()
+        return Statement(tree.data, tree.children, line, column)
+
+    def parse_statement_kind():
+        match peek():
+            # taggable ::= (TAG)? assign_stmt | tag_stmt ::= TAG
+            case "TAG":
+                tag = advance()
+                if peek() == "CNAME":
+                    return Tree("taggable", [Token("TAG", tag[1]), parse_assign_stmt(parse_identifier())])
+                return Tree("tag_stmt", [Token("TAG", tag[1])])
+            # swap_stmt ::= "swap" identifier identifier
+            case "swap":
+                advance()
+                return Tree("swap_stmt", [parse_identifier(), parse_identifier()])
+            # print_stmt ::= "print" comparison (assert)?
+            case "print":
+                advance()
+                children = [parse_comparison()]
+                if peek() == "->":
+                    children.append(parse_assert())
+                return Tree("print_stmt", children)
+            # assign_stmt | assert_stmt ::= identifier assert
+            case "CNAME":
+                identifier = parse_identifier()
+                if peek() == "->":
+                    return Tree("assert_stmt", [identifier, parse_assert()])
+                return Tree("taggable", [parse_assign_stmt(identifier)])
+        error(tokens[current_token_index], "statement")
+
+    # assign_stmt ::= identifier "=" (vector | expr)
+    def parse_assign_stmt(identifier):
+        expect("=")
+        return Tree("assign_stmt", [identifier, parse_vector() if peek() == "[" else parse_expr()])
+
+    # assert ::= "->" STRING
+    def parse_assert():
+        expect("->")
+        return Tree("assert", [Token("STRING", expect("STRING")[1])])
+
+    # identifier ::= CNAME ("[" expr "]")?
+    def parse_identifier():
+        token = advance()
+        if token[0] not in NAMES:
+            error(token, "name")
+        children = [Token("CNAME", token[1])]
+        if peek() == "[":
+            advance()
+            children.append(parse_expr())
+            expect("]")
+        return Tree("identifier", children)
+
+    # vector ::= "[" (expr ("," expr)*)? "]"
+    def parse_vector():
+        expect("[")
+        items = []
+        if peek() != "]":
+            items.append(parse_expr())
+            while peek() == ",":
+                advance()
+                items.append(parse_expr())
+        expect("]")
+        return Tree("vector", items)
+
+    # left op right-chain on each of `levels`, e.g. comparison ::= expr | expr "==" comparison -> eq,
+    # the expressions in parentheses, indexes and reductions open are on a stack,
+    # each with its closing token, what it is (None for parentheses, else the
+    # opening token and the name before it) and the operands and operators read
+    # so far on each level (those before their operators)
+    def chains(levels):
+        open, closing, inside, operands = [], None, None, [([], []) for _ in levels]
+        while True:
+            # factor ::= "(" expr ")" | CNAME "(" expr ")" -> reduction, identifier ::= CNAME "[" expr "]"
+            kind = peek()
+            if kind == "(" or kind in NAMES and tokens[current_token_index + 1][0] in ("(", "["):
+                open.append((closing, inside, levels, operands))
+                inside = None if kind == "(" else (tokens[current_token_index + 1][0], advance()[1])
+                closing = "]" if advance()[0] == "[" else ")"
+                levels, operands = LEVELS[:2], [([], []), ([], [])]
+                continue
+            operand = parse_factor()
+            # the chains ending after it, innermost first, up to one an operator goes on
+            while True:
+                kind = peek()
+                for (operators, rule), (chain, ops) in zip(levels, operands):
+                    if kind in operators:
+                        chain.append(operand)
+                        ops.append(operators[advance()[0]])
+                        break
+                    operand = Tree(rule, [operand])
+                    while ops:
+                        operand = Tree(ops.pop(), [chain.pop(), operand])
+                else:
+                    # all ended, the whole expression
+                    if not open:
+                        return operand
+                    expect(closing)
+                    if inside is None:
+                        operand = Tree("factor", [operand])
+                    elif inside[0] == "(":
+                        operand = Tree("reduction", [Token("CNAME", inside[1]), operand])
+                    else:
+                        operand = Tree("factor", [Tree("identifier", [Token("CNAME", inside[1]), operand])])
+                    closing, inside, levels, operands = open.pop()
+                    continue
+                break
+
+    def parse_comparison():
+        return chains(LEVELS)
+
+    def parse_expr():
+        return chains(LEVELS[:2])
+
+    # factor ::= SIGNED_NUMBER -> number | identifier | "True" -> true | "False" -> false,
+    # the ones opening an expression are parsed in chains
+    def parse_factor():
+        match peek():
+            case "SIGNED_NUMBER":
+                return Tree("number", [Token("SIGNED_NUMBER", advance()[1])])
+            case "True":
+                advance()
+                return Tree("true", [])
+            case "False":
+                advance()
+                return Tree("false", [])
+        return Tree("factor", [parse_identifier()])
+
+    return Tree("program", parse_program())
+
+# **** conformance and benchmark ****
+if (__name__ == "__main__"):
+    import os
+    import sys
+    import time
+
+    import frontend
+    import syntax
+
+    COLORS = {'cyan': '\033[96m', 'green': '\033[92m', 'fail': '\033[91m', 'end': '\033[0m'}
+
+    # python3 handparser.py --bench [megabytes], parse a large program made of the test files
+    if "--bench" in sys.argv:
+        size = float(next((arg for arg in sys.argv[1:] if not arg.startswith("--")), 2)) * 1024 * 1024
+        chunk = "\n".join(open(os.path.join("tests", name), "r").read() for name in sorted(os.listdir("tests")))
+        source = "\n".join([chunk] * int(size / len(chunk) + 1))
+        print(f"{COLORS['cyan']}Parsing {len(source) / 1024 / 1024:.1f} MB{COLORS['end']}")
+        for name, parse_source in (("lark", frontend.parser().parse), ("handwritten", parse)):
+            start = time.perf_counter()
+            parse_source(source)
+            print(f"  {name:<12} {time.perf_counter() - start:7.2f} s")
+    # python3 handparser.py, same tree as lark on every test
+    else:
+        print(f"{COLORS['cyan']}Checking conformance with lark{COLORS['end']}")
+        failed = 0
+        for path, subdirs, files in os.walk("tests"):
+            for name in files:
+                test = os.path.join(path, name)
+                source = open(test, "r").read()
+                if syntax.encode(parse(source)) == syntax.encode(frontend.parser().parse(source)):
+                    print(f"  {test} {COLORS['green']}OK{COLORS['end']}")
+                else:
+                    failed += 1
+                    print(f"  {test} {COLORS['fail']}Failed{COLORS['end']}")
+        print(f"{COLORS['cyan']}Done{COLORS['end']}")
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,93 @@
+# **** PlayCode native builds ****
+
+# compiles generated C with gcc (or $CC), binaries are kept in the cache keyed by
+# a hash of the C source, compiler and flags, so identical C is only compiled
+# once, every build writes to a temporary path of its own and is renamed into
+# place, so concurrent runs never see (or clobber) each other's files
+
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+import cache
+
+PROFILES = {
+    "O0": ["-O0"],
+    "O2": ["-O2"],
+    "O3": ["-O3"],
+    "native": ["-O3", "-march=native"],
+}
+
+CC = os.environ.get("CC", "gcc")
+
+class BuildError(Exception):
+    pass
+
+# resolved path, size and mtime of the compiler, changes when it is upgraded
+def compiler():
+    path = shutil.which(CC)
+    if path is None:
+        raise BuildError(f"C compiler {CC!r} not found")
+    stat = os.stat(os.path.realpath(path))
+    return f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def flags(profile, shared=False):
+    if profile not in PROFILES:
+        raise BuildError(f"Unknown build profile {profile!r}, expected one of {', '.join(PROFILES)}")
+    # int arithmetic past 64 bits wraps (as with --vectors=numpy) instead of being undefined
+    return PROFILES[profile] + ["-fwrapv"] + (["-shared", "-fPIC"] if shared else [])
+
+def build(source, output, profile="O2", shared=False):
+    with tempfile.NamedTemporaryFile("w", suffix=".c", prefix="playcode-", delete=False) as f:
+        f.write(source)
+    try:
+        result = subprocess.run([CC, *flags(profile, shared), "-o", output, f.name, "-lm"], capture_output=True, text=True)
+    except OSError as e:
+        raise BuildError(f"{CC}: {e}")
+    finally:
+        os.remove(f.name)
+    if result.returncode != 0:
+        raise BuildError(f"{CC} exited with code {result.returncode}\n{result.stderr.strip()}")
+
+# path of a binary (or shared library) built from `source`, from the cache when
+# it is enabled, else from a temporary directory that is removed afterwards
+@contextmanager
+def binary(source, profile="O2", shared=False):
+    name = ("so-" if shared else "bin-") + cache.key(compiler(), flags(profile, shared), source)
+    path = os.path.join(cache.CACHE_DIR, name)
+    if cache.ENABLED:
+        if os.path.exists(path):
+            # mtime doubles as last use for eviction
+            os.utime(path)
+            yield path
+            return
+        try:
+            os.makedirs(cache.CACHE_DIR, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache.CACHE_DIR, prefix=".tmp-")
+            os.close(fd)
+        except OSError:
+            tmp = None
+        if tmp is not None:
+            try:
+                build(source, tmp, profile, shared)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp): os.remove(tmp)
+            cache.evict()
+            yield path
+            return
+    directory = tempfile.mkdtemp(prefix="playcode-")
+    try:
+        path = os.path.join(directory, name)
+        build(source, path, profile, shared)
+        yield path
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+# run a built binary, its output goes straight to ours, returns its exit status
+# (128 + signal if it was killed, like a shell)
+def run(path, stdout=None, stderr=None):
+    result = subprocess.run([path], stdout=stdout, stderr=stderr)
+    return result.returncode if result.returncode >= 0 else 128 - result.returncode
@@ -0,0 +1,185 @@
+# **** PlayCode hot-loop offload ****
+
+# the tree walker counts the iterations of every while loop, a loop that has run
+# THRESHOLD of them (over all its runs) is translated on its own by pcc.py's
+# codegen, built into a shared library and called through ctypes for the rest
+# of the loop and every later run of it, with the variables it uses passed in
+# and copied back, typed vectors by their buffer so stores land in place
+#
+# a loop stays in the walker, with a log line saying why, if it prints or
+# asserts (output goes through pc.py's stream), defines or calls tags, builds
+# new vectors, or uses anything the C back end cannot run the way pc.py does,
+# and falls back to it when its variables no longer have the kinds it was
+# compiled for, or when the native loop stops on an error (an int outgrowing 64
+# bits among them): it hands back the variables, vectors too, as the iteration
+# it stopped in began, and the walker runs that iteration again, so an int
+# keeps growing and any other error is raised by pc.py itself
+
+import ctypes
+import sys
+
+import syntax
+import vectors
+
+COLORS = {
+    'cyan': '\033[96m',
+    'warning': '\033[93m',
+    'end': '\033[0m',
+}
+
+THRESHOLD = 1000
+
+class CVector(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_longlong), ("data", ctypes.c_void_p)]
+
+CTYPES = {"int": ctypes.c_longlong, "bool": ctypes.c_int, "float": ctypes.c_double}
+
+class Unsupported(Exception):
+    pass
+
+# kind of a runtime value as pcc.py names them, None if C cannot hold it
+def kind(value):
+    if type(value) is bool:
+        return "bool"
+    if type(value) is int:
+        return "int" if -2**63 <= value < 2**63 else None
+    if type(value) is float:
+        return "float"
+    if type(value) is vectors.Vector and value.typecode == "q":
+        return "vector"
+    return None
+
+# a compiled loop, called with the symbol table
+class Loop:
+    def __init__(self, function, names):
+        self.function = function
+        self.names = names
+        function.argtypes = [ctypes.POINTER(ctypes.c_char_p)] + [
+            ctypes.POINTER(CVector if kind == "vector" else CTYPES[kind]) for kind in names.values()]
+        function.restype = ctypes.c_int
+
+    # runs the loop to the end and returns True, or False (with why) if the variables changed
+    # kind or the loop stopped on an error part way, the walker goes on from there
+    def __call__(self, symbols):
+        arguments, cells, shared = [], {}, {}
+        for name, expected in self.names.items():
+            value = symbols.get(name)
+            if kind(value) != expected:
+                return False, f"{name} is no longer {expected}"
+            if expected == "vector":
+                # aliases get the same struct, like they share the list
+                if id(value) not in shared:
+                    address, length = value.buffer_info()
+                    shared[id(value)] = CVector(length, address)
+                arguments.append(ctypes.byref(shared[id(value)]))
+            else:
+                cells[name] = CTYPES[expected](value)
+                arguments.append(ctypes.byref(cells[name]))
+        error = ctypes.c_char_p()
+        stopped = self.function(ctypes.byref(error), *arguments) < 0
+        for name, cell in cells.items():
+            symbols[name] = bool(cell.value) if self.names[name] == "bool" else cell.value
+        if stopped:
+            return False, f"it stopped on {error.value.decode()}"
+        return True, None
+
+class Offload:
+    def __init__(self, threshold=THRESHOLD, profile="O2", log=sys.stderr):
+        self.threshold = threshold
+        self.profile = profile
+        self.log = log
+        self.counts = {}    # id(loop) -> iterations walked
+        self.loops = {}     # id(loop) -> Loop, or False if it stays in the walker
+        self.libraries = [] # loaded libraries, kept for the life of the run
+
+    def run(self, loop, symbols, visit):
+        native = self.loops.get(id(loop))
+        if native is None:
+            count = self.counts.get(id(loop), 0)
+            while count < self.threshold:
+                if not visit(loop.children[0]):
+                    self.counts[id(loop)] = count
+                    return
+                visit(loop.children[1])
+                count += 1
+            self.counts[id(loop)] = count
+            native = self.loops[id(loop)] = self.compile(loop, symbols)
+        if native:
+            done, reason = native(symbols)
+            if done:
+                return
+            self.report(loop, f"back in the interpreter, {reason}")
+            self.loops[id(loop)] = False
+        while visit(loop.children[0]):
+            visit(loop.children[1])
+
+    def report(self, loop, message):
+        line, column = syntax.position(loop)
+        print(f"{COLORS['warning']}offload: loop at line {line}: {message}{COLORS['end']}", file=self.log)
+
+    def compile(self, loop, symbols):
+        import native
+        import pcc
+        try:
+            names = self.names(loop, symbols)
+            analysis = pcc.analyze(loop, names)
+            self.check(loop, analysis)
+            out = pcc.Emitter()
+            # checked, an int outgrowing 64 bits raises instead of wrapping
+            pcc.codegen(loop, analysis, out, function="pc_loop", checked=True)
+            with native.binary(out.getvalue(), self.profile, shared=True) as path:
+                library = ctypes.CDLL(path)
+        except (Unsupported, pcc.Unsupported) as e:
+            self.report(loop, f"stays in the interpreter, {e}")
+            return False
+        except native.BuildError as e:
+            self.report(loop, f"stays in the interpreter, build failed: {e}")
+            return False
+        self.libraries.append(library)
+        self.report(loop, f"runs natively after {self.counts[id(loop)]} iterations")
+        return Loop(library.pc_loop, analysis.names)
+
+    # the variables the loop uses and their kinds now, in order of first use
+    def names(self, loop, symbols):
+        names, stack = {}, [loop]
+        while stack:
+            node = stack.pop()
+            match node.data:
+                case "print_stmt" | "assert_stmt":
+                    raise Unsupported("it prints or asserts")
+                case "taggable" if len(node.children) > 1:
+                    raise Unsupported(f"it defines tag {node.children[0]}")
+                case "tag_stmt":
+                    raise Unsupported(f"it calls tag {node.children[0]}")
+                # an element step of a postfix node (see syntax.postfix) names its vector too
+                case "identifier" | "element":
+                    name = str(node.children[0])
+                    if name not in names:
+                        if name not in symbols:
+                            raise Unsupported(f"{name} is not set yet")
+                        if kind(symbols[name]) is None:
+                            raise Unsupported(f"{name} holds a {type(symbols[name]).__name__} C cannot hold")
+                        names[name] = kind(symbols[name])
+            stack.extend(child for child in reversed(node.children) if isinstance(child, syntax.Tree))
+        return names
+
+    # vectors are shared with pc.py in place, so the loop may store into them but not make new ones
+    def check(self, loop, analysis):
+        import pcc
+        stack = [loop]
+        while stack:
+            node = stack.pop()
+            match node.data:
+                case "postfix":
+                    # of its steps only the leaves have kinds, operators are worked out here
+                    kinds = pcc.stacked(node, analysis.kinds)
+                    if any(step.data in ("add", "sub", "mul") and kind == "vector" for step, kind in zip(node.children, kinds)):
+                        raise Unsupported("it builds new vectors")
+                    continue
+                case "vector" | "add" | "sub" | "mul" if analysis.kinds[id(node)] == "vector":
+                    raise Unsupported("it builds new vectors")
+                case "assign_stmt" if len(node.children[0].children) == 1 and analysis.names[str(node.children[0].children[0])] == "vector":
+                    raise Unsupported(f"it assigns the whole vector {node.children[0].children[0]}")
+                case "swap_stmt" if all(len(side.children) == 1 for side in node.children) and analysis.names[str(node.children[0].children[0])] == "vector":
+                    raise Unsupported("it swaps whole vectors")
+            stack.extend(child for child in node.children if isinstance(child, syntax.Tree))
@@ -0,0 +1,75 @@
+# **** PlayCode optimizer ****
+
+# simplifies a (lowered, see syntax.lower) tree before it is run or compiled,
+# shared by pc.py and pcc.py:
+#   arithmetic and comparisons on literals are folded (not /, its float has no literal)
+#   if on a literal keeps the branch the walker would take, while on a false one goes
+# folding follows the walker: operands go through int(), results print the same
+
+import syntax
+
+ENABLED = True
+
+FOLD = {
+    "add": lambda a, b: int(a) + int(b),
+    "sub": lambda a, b: int(a) - int(b),
+    "mul": lambda a, b: int(a) * int(b),
+    "eq": lambda a, b: int(a) == int(b),
+    "neq": lambda a, b: int(a) != int(b),
+    "lt": lambda a, b: int(a) < int(b),
+    "gt": lambda a, b: int(a) > int(b),
+}
+
+# value of a literal node, None for anything else (a literal like 1.5 fails at runtime, so it stays)
+def constant(node):
+    match node.data:
+        case "number":
+            try:
+                return int(node.children[0])
+            except ValueError:
+                return None
+        case "true":
+            return True
+        case "false":
+            return False
+    return None
+
+def literal(value):
+    if value is True: return syntax.Tree("true", [])
+    if value is False: return syntax.Tree("false", [])
+    return syntax.Tree("number", [value])
+
+def simplify(node):
+    if node.data in FOLD:
+        left, right = constant(node.children[0]), constant(node.children[1])
+        if left is not None and right is not None:
+            return literal(FOLD[node.data](left, right))
+    return node
+
+# statements that replace `node` in its program, `node` itself unless its condition is a literal
+def prune(node):
+    if node.data in ("if_stmt", "while_stmt"):
+        condition = constant(node.children[0])
+        if condition is not None:
+            if node.data == "while_stmt":
+                return [node] if condition else []
+            # like the walker, children[1] runs on true and children[2] on false
+            taken = node.children[1 if condition else 2] if len(node.children) > (1 if condition else 2) else None
+            return taken.children if taken is not None else []
+    return [node]
+
+def optimize(tree):
+    if not ENABLED:
+        return tree
+    # parents come before children in `order`, so walking it backwards simplifies bottom-up
+    order, stack = [], [tree]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(child for child in node.children if isinstance(child, syntax.Tree))
+    for node in reversed(order):
+        children = [simplify(child) if isinstance(child, syntax.Tree) else child for child in node.children]
+        if node.data == "program":
+            children = [statement for child in children for statement in prune(child)]
+        node.children = children
+    return tree
@@ -0,0 +1,44 @@
+# **** PlayCode program output ****
+
+# engines print through STDOUT.append, a Stream writes those lines to a file as
+# the program runs instead of holding them all until it exits, flush policy:
+#   line  write and flush every line
+#   size  buffer up to `size` bytes, then write (default)
+#   end   buffer everything and write on close
+
+POLICIES = ("line", "size", "end")
+
+class Stream:
+    def __init__(self, file, policy="size", size=64 * 1024):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown flush policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.file = file
+        self.size = size
+        self.buffer = []
+        self.pending = 0
+        self.lines = 0
+        # bound once, engines call append for every print
+        self.append = self.append_line if policy == "line" else self.append_buffered
+        self.limit = size if policy == "size" else float("inf")
+
+    def append_line(self, line):
+        self.lines += 1
+        self.file.write(line + "\n")
+        self.file.flush()
+
+    def append_buffered(self, line):
+        self.lines += 1
+        self.buffer.append(line)
+        self.pending += len(line) + 1
+        if self.pending >= self.limit:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+            self.pending = 0
+        self.file.flush()
+
+    def __len__(self):
+        return self.lines
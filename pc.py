@@ -2,10 +2,30 @@
 
 # **** PlayCode interpreter ****
 
+import time
 import os
 import sys
 
-from lark import Lark, Tree, Transformer
+# startup timestamps, written to stderr for --startup-bench
+STARTUP = {"start": time.perf_counter()} if "PLAYCODE_STARTUP" in os.environ else None
+
+# engines are imported on first use, so startup only pays for the one selected
+import cache
+import frontend
+import optimizer
+import syntax
+import vectors
+
+ENGINE = "tree"
+
+# profiler.Profile with --profile, tree engine only
+PROFILE = None
+
+# offload.Offload with --offload, tree engine only
+OFFLOAD = None
+
+# budget.Budget with --max-steps or --timeout
+BUDGET = None
 
 COLORS = {
     'header': '\033[95m',
@@ -19,10 +39,6 @@ COLORS = {
     'underline': '\033[4m',
 }
 
-parser = Lark(open("pc.lark", "r").read(), start="program", parser="lalr")
-
-cout = """"""
-
 def visitor(tree):
     match tree.data:
         case "program":
@@ -30,33 +46,36 @@ def visitor(tree):
                 visitor(branch)
             return
         case "taggable":
-            try:
-                if tree.children[0].type == "TAG":
-                    TAG_TABLE[tree.children[0].value] = tree.children[1]
-            except:
+            if len(tree.children) > 1:
+                tag, body = tree.children
+                TAG_TABLE[tag.value] = body
+                tag.call = compile_tag(body)
+            else:
                 return visitor(tree.children[0])
         case "assign_stmt":
             left, right = tree.children
             if len(left.children) > 1:
-                SYMBOL_TABLE[left.children[0].value][visitor(left.children[1])] = visitor(right)
+                vectors.store(SYMBOL_TABLE[left.children[0]], visitor(left.children[1]), visitor(right), (SYMBOL_TABLE,))
             else:
-                SYMBOL_TABLE[left.children[0].value] = visitor(right)
+                SYMBOL_TABLE[left.children[0]] = visitor(right)
         case "tag_stmt":
-            return visitor(TAG_TABLE[tree.children[0].value])
+            tag = tree.children[0]
+            tag.hits += 1
+            return tag.call()
         case "swap_stmt":
             left, right = tree.children
             if len(left.children) > 1 and len(right.children) > 1:
                 tmp = SYMBOL_TABLE[left.children[0]][visitor(left.children[1])]
-                SYMBOL_TABLE[left.children[0]][visitor(left.children[1])] = SYMBOL_TABLE[right.children[0]][visitor(right.children[1])]
-                SYMBOL_TABLE[right.children[0]][visitor(right.children[1])] = tmp
+                vectors.store(SYMBOL_TABLE[left.children[0]], visitor(left.children[1]), SYMBOL_TABLE[right.children[0]][visitor(right.children[1])], (SYMBOL_TABLE,))
+                vectors.store(SYMBOL_TABLE[right.children[0]], visitor(right.children[1]), tmp, (SYMBOL_TABLE,))
             elif len(left.children) > 1:
                 tmp = SYMBOL_TABLE[left.children[0]][visitor(left.children[1])]
-                SYMBOL_TABLE[left.children[0]][visitor(left.children[1])] = SYMBOL_TABLE[right.children[0]]
+                vectors.store(SYMBOL_TABLE[left.children[0]], visitor(left.children[1]), SYMBOL_TABLE[right.children[0]], (SYMBOL_TABLE,))
                 SYMBOL_TABLE[right.children[0]] = tmp
             elif len(right.children) > 1:
                 tmp = SYMBOL_TABLE[left.children[0]]
                 SYMBOL_TABLE[left.children[0]] = SYMBOL_TABLE[right.children[0]][visitor(right.children[1])]
-                SYMBOL_TABLE[right.children[0]][visitor(right.children[1])] = tmp
+                vectors.store(SYMBOL_TABLE[right.children[0]], visitor(right.children[1]), tmp, (SYMBOL_TABLE,))
             else:
                 tmp = SYMBOL_TABLE[left.children[0]]
                 SYMBOL_TABLE[left.children[0]] = SYMBOL_TABLE[right.children[0]]
@@ -67,38 +86,51 @@ def visitor(tree):
             elif len(tree.children) > 2:
                 return visitor(tree.children[2])
         case "while_stmt":
+            if OFFLOAD is not None and len(tree.children) > 1:
+                return OFFLOAD.run(tree, SYMBOL_TABLE, visitor)
+            if BUDGET is not None:
+                budget = BUDGET
+                while visitor(tree.children[0]):
+                    visitor(tree.children[1])
+                    budget.left -= 1
+                    if budget.left < 0: budget.refill()
+                return
             while visitor(tree.children[0]):
                 visitor(tree.children[1])
         case "assert_stmt":
             value = str(visitor(tree.children[0]))
-            if not value == tree.children[1].children[0][1:-1]:
-                STDERR.append(f"Assert error: {value} not equal to {tree.children[1].children[0][1:-1]}")
+            if not value == tree.children[1].children[0]:
+                STDERR.append(f"Assert error: {value} not equal to {tree.children[1].children[0]}")
         case "print_stmt":
             output = str(visitor(tree.children[0]))
             if len(tree.children) > 1 and tree.children[1].data == "assert":
-                if not output == tree.children[1].children[0][1:-1]:
-                    STDERR.append(f"Assert error: {output} not equal to {tree.children[1].children[0][1:-1]}")
+                if not output == tree.children[1].children[0]:
+                    STDERR.append(f"Assert error: {output} not equal to {tree.children[1].children[0]}")
             STDOUT.append(output)
-        case "comparison":
-            return visitor(tree.children[0])
-        case "expr":
-            return visitor(tree.children[0])
-        case "term":
-            return visitor(tree.children[0])
-        case "factor":
-            return visitor(tree.children[0])
         case "add":
-            left, right = tree.children
-            return int(visitor(left)) + int(visitor(right))
+            left, right = visitor(tree.children[0]), visitor(tree.children[1])
+            try:
+                return int(left) + int(right)
+            except TypeError:
+                return vectors.binary("add", left, right)
         case "sub":
-            left, right = tree.children
-            return int(visitor(left)) - int(visitor(right))
+            left, right = visitor(tree.children[0]), visitor(tree.children[1])
+            try:
+                return int(left) - int(right)
+            except TypeError:
+                return vectors.binary("sub", left, right)
         case "mul":
-            left, right = tree.children
-            return int(visitor(left)) * int(visitor(right))
+            left, right = visitor(tree.children[0]), visitor(tree.children[1])
+            try:
+                return int(left) * int(right)
+            except TypeError:
+                return vectors.binary("mul", left, right)
         case "div":
-            left, right = tree.children
-            return int(visitor(left)) / int(visitor(right))
+            left, right = visitor(tree.children[0]), visitor(tree.children[1])
+            try:
+                return int(left) / int(right)
+            except TypeError:
+                return vectors.binary("div", left, right)
         case "eq":
             left, right = tree.children
             return int(visitor(left)) == int(visitor(right))
@@ -115,53 +147,335 @@ def visitor(tree):
             data = []
             for branch in tree.children:
                 data.append(visitor(branch))
-            return list(data)
+            return vectors.vector(data)
+        case "reduction":
+            return vectors.reduce(tree.children[0], visitor(tree.children[1]))
         case "number":
-            return int(tree.children[0])
+            # an int since lowering, unless int() rejects the literal (1.5), which fails here
+            value = tree.children[0]
+            return value if type(value) is int else int(value)
         case "identifier":
             if len(tree.children) > 1:
-                return SYMBOL_TABLE[str(tree.children[0])][int(visitor(tree.children[1]))]
+                return SYMBOL_TABLE[tree.children[0]][int(visitor(tree.children[1]))]
             else:
-                return SYMBOL_TABLE[str(tree.children[0])]
+                return SYMBOL_TABLE[tree.children[0]]
         case "true":
             return True
         case "false":
             return False
+        case "postfix":
+            return evaluate(tree.children)
+        case "linear":
+            return linear(tree.children)
+
+# an expression flattened by syntax.flatten, its steps run on a stack of values
+# (as the cases above would), leaves go through the visitor
+def evaluate(steps):
+    values = []
+    for step in steps:
+        match step.data:
+            case "add" | "sub" | "mul" | "div":
+                right = values.pop()
+                left = values[-1]
+                try:
+                    match step.data:
+                        case "add": values[-1] = int(left) + int(right)
+                        case "sub": values[-1] = int(left) - int(right)
+                        case "mul": values[-1] = int(left) * int(right)
+                        case "div": values[-1] = int(left) / int(right)
+                except TypeError:
+                    values[-1] = vectors.binary(step.data, left, right)
+            case "eq":
+                right = values.pop()
+                values[-1] = values[-1] == int(right)
+            case "neq":
+                right = values.pop()
+                values[-1] = values[-1] != int(right)
+            case "lt":
+                right = values.pop()
+                values[-1] = values[-1] < int(right)
+            case "gt":
+                right = values.pop()
+                values[-1] = values[-1] > int(right)
+            case "int":
+                values[-1] = int(values[-1])
+            case "element":
+                values[-1] = SYMBOL_TABLE[step.children[0]][int(values[-1])]
+            case "reduction":
+                values[-1] = vectors.reduce(step.children[0], values[-1])
+            case _:
+                values.append(visitor(step))
+    return values[0]
+
+# blocks taken apart by syntax.flatten, run with a step counter, statements go
+# through the visitor and a jump back is a loop back edge
+def linear(steps):
+    pc = 0
+    while pc < len(steps):
+        step = steps[pc]
+        if step.data == "branch":
+            pc = pc + 1 if visitor(step.children[0]) else step.children[1]
+        elif step.data == "jump":
+            if BUDGET is not None and step.children[0] <= pc:
+                BUDGET.left -= 1
+                if BUDGET.left < 0: BUDGET.refill()
+            pc = step.children[0]
+        else:
+            visitor(step)
+            pc += 1
+
+# **** tags ****
+
+# one Tag per name replaces the TAG token of every definition and call site, a call
+# goes straight to the body compiled by the latest definition that ran
+class Tag(syntax.Token):
+    def __new__(cls, name):
+        tag = super().__new__(cls, "TAG", name)
+        tag.hits = 0
+        tag.call = tag.undefined
+        return tag
+
+    def undefined(self):
+        raise KeyError(self.value)
+
+def bind_tags(tree):
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.data in ("taggable", "tag_stmt") and isinstance(node.children[0], str):
+            name = node.children[0].value
+            if name not in TAGS: TAGS[name] = Tag(name)
+            node.children[0] = TAGS[name]
+        stack.extend(child for child in node.children if isinstance(child, syntax.Tree))
+
+# tag bodies are always assignments, compiled into a store to the target with
+# literals evaluated once, the profiler walks them as is
+def compile_tag(body):
+    left, right = body.children
+    name = left.children[0]
+    if PROFILE is not None:
+        def call():
+            visitor(body)
+    elif len(left.children) > 1:
+        index = left.children[1]
+        def call():
+            vectors.store(SYMBOL_TABLE[name], visitor(index), visitor(right), (SYMBOL_TABLE,))
+    elif right.data == "number" and type(right.children[0]) is int:
+        value = right.children[0]
+        def call():
+            SYMBOL_TABLE[name] = value
+    else:
+        def call():
+            SYMBOL_TABLE[name] = visitor(right)
+    return call if BUDGET is None else BUDGET.counted(call)
+
+# compiled bytecode is cached on its own so a hit skips the parse tree entirely
+def compile_vm(source):
+    import vm
+    name = f"vm-{cache.key(cache.sources(*frontend.SOURCES, 'optimizer.py', 'resolve.py', 'vm.py'), frontend.grammar(), frontend.PARSER, optimizer.ENABLED, source)}"
+    data = cache.load(name)
+    if data is None:
+        data = vm.dump(vm.compile_program(optimizer.optimize(frontend.parse(source))))
+        cache.store(name, data)
+    return vm.load(data)
+
+# visitor is rebound to the profiling wrapper for one run, so the walker costs nothing extra without --profile
+def profile(tree):
+    global visitor
+    walk = visitor
+    visitor = PROFILE.wrap(tree, walk)
+    try:
+        for branch in tree.children: visitor(branch)
+    finally:
+        visitor = walk
+
+# fresh tables, prints go to `stdout` (anything with append, e.g. output.Stream) or a new list,
+# failed asserts to `stderr` or a new list
+def reset(stdout=None, stderr=None):
+    global SYMBOL_TABLE, TAG_TABLE, TAGS, STDOUT, STDERR
+    SYMBOL_TABLE = {}
+    TAG_TABLE = {}
+    TAGS = {}
+    STDOUT = [] if stdout is None else stdout
+    STDERR = [] if stderr is None else stderr
+
+# run a parsed program on the tree engine against the current tables, which the REPL keeps between inputs
+def execute(tree):
+    tree = syntax.flatten(optimizer.optimize(tree))
+    bind_tags(tree)
+    for branch in tree.children: visitor(branch)
+
+# run source with fresh tables using selected engine, tree walker is the reference
+def run(source, stdout=None, stderr=None):
+    reset(stdout, stderr)
+    if ENGINE == "closure":
+        import closure
+        program = closure.compile_program(optimizer.optimize(frontend.parse(source)), SYMBOL_TABLE, TAG_TABLE, STDOUT, STDERR, BUDGET)
+        if STARTUP is not None: STARTUP["first_statement"] = time.perf_counter()
+        program()
+    elif ENGINE == "python":
+        import pysource
+        code = pysource.compile_source(source, BUDGET is not None)
+        if STARTUP is not None: STARTUP["first_statement"] = time.perf_counter()
+        pysource.run(code, STDOUT, STDERR, TAG_TABLE, SYMBOL_TABLE, BUDGET)
+    elif ENGINE == "vm":
+        import vm
+        program = compile_vm(source)
+        if STARTUP is not None: STARTUP["first_statement"] = time.perf_counter()
+        vm.run(program, SYMBOL_TABLE, TAG_TABLE, STDOUT, STDERR, BUDGET)
+    else:
+        tree = syntax.flatten(optimizer.optimize(frontend.parse(source)))
+        bind_tags(tree)
+        if STARTUP is not None: STARTUP["first_statement"] = time.perf_counter()
+        if PROFILE is not None:
+            profile(tree)
+        else:
+            for branch in tree.children: visitor(branch)
+
+# run source and hand back what it printed and asserted, used by the test runner,
+# which passes the lists in so it keeps them when the program stops on an error
+def capture(source, stdout=None, stderr=None):
+    run(source, stdout, stderr)
+    return STDOUT, STDERR
+
+# python3 pc.py <file> --startup-bench, time fresh interpreter runs of the file
+def startup_bench(args, runs):
+    import statistics
+    import subprocess
+    phases = {}
+    for i in range(runs):
+        spawn = time.perf_counter()
+        result = subprocess.run([sys.executable, __file__] + args, env=dict(os.environ, PLAYCODE_STARTUP="1"),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        finish = time.perf_counter()
+        times = dict(spawn=spawn, exit=finish)
+        for line in result.stderr.splitlines():
+            if line.startswith("PLAYCODE_STARTUP "):
+                times.update((name, float(value)) for name, value in (pair.split("=") for pair in line.split()[1:]))
+        # perf_counter is the system monotonic clock, so parent and child times line up
+        marks = [("interpreter", "spawn", "start"), ("imports", "start", "imports"),
+                 ("parse and compile", "imports", "first_statement"), ("first statement", "spawn", "first_statement"),
+                 ("total", "spawn", "exit")]
+        for label, begin, end in marks:
+            if begin in times and end in times:
+                phases.setdefault(label, []).append((times[end] - times[begin]) * 1000)
+    print(f"{COLORS['cyan']}Startup over {runs} runs (median / min){COLORS['end']}")
+    for label, values in phases.items():
+        print(f"  {label:<18} {statistics.median(values):7.1f} ms {min(values):7.1f} ms")
+    # -X importtime style, slowest imports by cumulative time
+    result = subprocess.run([sys.executable, "-X", "importtime", __file__] + args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and not line.endswith("package"):
+            self_us, cumulative_us, name = (field.strip() for field in line[len("import time:"):].split("|"))
+            imports.append((int(cumulative_us), int(self_us), name.strip()))
+    print(f"{COLORS['cyan']}Slowest imports (cumulative / self){COLORS['end']}")
+    for cumulative_us, self_us, name in sorted(imports, reverse=True)[:8]:
+        print(f"  {name:<24} {cumulative_us / 1000:7.1f} ms {self_us / 1000:7.1f} ms")
 
 # **** main ****
 if (__name__ == "__main__"):
-    # python3 pc.py --tests
-    if "--tests" in sys.argv:
-        print(f"{COLORS['cyan']}Running tests{COLORS['end']}")
-        for path, subdirs, files in os.walk("tests"):
-            for name in files:
-                test = os.path.join(path, name)
-                tree = parser.parse(open(test, "r").read())
-                SYMBOL_TABLE = {}
-                TAG_TABLE = {}
-                STDOUT = []
-                STDERR = []
-                for branch in tree.children: visitor(branch)
-                if len(STDERR) == 0:
-                    print(f"  {test} {COLORS['green']}OK{COLORS['end']}")
-                else:
-                    print(f"  {test} {COLORS['fail']}Failed{COLORS['end']}")
-                    for error in enumerate(STDERR, 1):
-                        print(f"    {COLORS['fail']}{error[0]} - {error[1]}{COLORS['end']}")
-        print(f"{COLORS['cyan']}Done{COLORS['end']}")
-    # python3 pc.py <file> --tables
+    if STARTUP is not None: STARTUP["imports"] = time.perf_counter()
+    # python3 pc.py <file> --engine=tree|closure|vm|python
+    ENGINE = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--engine=")), "tree")
+    # python3 pc.py <file> --no-cache
+    cache.ENABLED = "--no-cache" not in sys.argv
+    # python3 pc.py <file> --no-opt
+    optimizer.ENABLED = "--no-opt" not in sys.argv
+    # python3 pc.py <file> --parser=lark|handwritten
+    frontend.PARSER = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--parser=")), "lark")
+    # python3 pc.py <file> --vectors=array|numpy|list
+    try:
+        vectors.select(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--vectors=")), "array"))
+    except ValueError as e:
+        print(f"{COLORS['fail']}{e}{COLORS['end']}", file=sys.stderr)
+        sys.exit(2)
+    except ImportError:
+        print(f"{COLORS['warning']}--vectors=numpy needs NumPy, which is not installed, using array{COLORS['end']}", file=sys.stderr)
+    # python3 pc.py <file> --startup-bench --runs=N
+    if "--startup-bench" in sys.argv:
+        runs = int(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--runs=")), 10))
+        startup_bench([arg for arg in sys.argv[1:] if arg != "--startup-bench" and not arg.startswith("--runs=")], runs)
+    # python3 pc.py --tests --jobs=N --test-timeout=S --json=<file> --junit=<file> --offload[=N]
+    elif "--tests" in sys.argv:
+        import runner
+        if any(arg == "--offload" or arg.startswith("--offload=") for arg in sys.argv):
+            import offload
+            if ENGINE != "tree":
+                print(f"{COLORS['warning']}--offload runs the tree engine{COLORS['end']}", file=sys.stderr)
+                ENGINE = "tree"
+            OFFLOAD = offload.Offload(int(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--offload=")), offload.THRESHOLD)),
+                                      next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--build=")), "O2"))
+        if not runner.main(sys.argv, capture): sys.exit(1)
+    # python3 pc.py --repl
+    elif "--repl" in sys.argv:
+        import output
+        import repl
+        if ENGINE != "tree":
+            print(f"{COLORS['warning']}--repl runs the tree engine{COLORS['end']}", file=sys.stderr)
+        reset(output.Stream(sys.stdout, "line"))
+        repl.Repl(execute, SYMBOL_TABLE, TAG_TABLE, STDERR).loop()
+    # python3 pc.py <file> --dis
+    elif "--dis" in sys.argv:
+        file = open(next(arg for arg in sys.argv[1:] if not arg.startswith("--")), "r").read()
+        import vm
+        print(vm.disassemble(compile_vm(file)))
+    # python3 pc.py <file> --tables --tag-stats --flush=line|size|end --profile[=<file>] --offload[=N] --build=O0|O2|O3|native
+    #                        --max-steps=N --timeout=S
     elif len(sys.argv) > 1:
-        file = open(sys.argv[1], "r").read()
-        tree = parser.parse(file)
-        SYMBOL_TABLE = {}
-        TAG_TABLE = {}
-        STDOUT = []
-        STDERR = []
-        for branch in tree.children: visitor(branch)
-        if not len(STDOUT) == 0:
-            for output in STDOUT: print(output)
+        file = open(next(arg for arg in sys.argv[1:] if not arg.startswith("--")), "r").read()
+        import budget
+        steps = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--max-steps=")), None)
+        seconds = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--timeout=")), None)
+        if steps is not None or seconds is not None:
+            BUDGET = budget.Budget(None if steps is None else int(steps), None if seconds is None else float(seconds))
+        if any(arg == "--profile" or arg.startswith("--profile=") for arg in sys.argv):
+            import profiler
+            if ENGINE != "tree":
+                print(f"{COLORS['warning']}--profile runs the tree engine{COLORS['end']}", file=sys.stderr)
+                ENGINE = "tree"
+            PROFILE = profiler.Profile(file)
+        if any(arg == "--offload" or arg.startswith("--offload=") for arg in sys.argv):
+            if PROFILE is not None:
+                print(f"{COLORS['warning']}--offload is off while profiling{COLORS['end']}", file=sys.stderr)
+            elif BUDGET is not None:
+                print(f"{COLORS['warning']}--offload is off with --max-steps or --timeout{COLORS['end']}", file=sys.stderr)
+            else:
+                import offload
+                if ENGINE != "tree":
+                    print(f"{COLORS['warning']}--offload runs the tree engine{COLORS['end']}", file=sys.stderr)
+                    ENGINE = "tree"
+                OFFLOAD = offload.Offload(int(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--offload=")), offload.THRESHOLD)),
+                                          next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--build=")), "O2"))
+        if "--tag-stats" in sys.argv and ENGINE != "tree":
+            print(f"{COLORS['warning']}--tag-stats runs the tree engine{COLORS['end']}", file=sys.stderr)
+            ENGINE = "tree"
+        import output
+        stream = output.Stream(sys.stdout, next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--flush=")), "size"))
+        stopped = None
+        try:
+            run(file, stream)
+        except budget.OutOfBudget as e:
+            stopped = e
+        finally:
+            stream.flush()
+        if stopped is not None:
+            print(f"{COLORS['fail']}Stopped: {stopped}{COLORS['end']}", file=sys.stderr)
         if "--tables" in sys.argv:
             print(f"{COLORS['warning']}SYMBOL_TABLE: {SYMBOL_TABLE}{COLORS['end']}")
             print(f"{COLORS['warning']}TAG_TABLE: {TAG_TABLE}{COLORS['end']}")
+        if "--tag-stats" in sys.argv:
+            print(f"{COLORS['cyan']}Tag calls{COLORS['end']}")
+            for tag in sorted(TAGS.values(), key=lambda tag: tag.hits, reverse=True):
+                print(f"  {tag.value:<16} {tag.hits:>9}")
+        if PROFILE is not None:
+            PROFILE.report()
+            path = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--profile=")), None)
+            if path: PROFILE.dump(path)
+        if stopped is not None:
+            sys.exit(1)
     else:
         print(f"{COLORS['fail']}No source file provided{COLORS['end']}")
+    if STARTUP is not None:
+        print("PLAYCODE_STARTUP " + " ".join(f"{name}={value}" for name, value in STARTUP.items()), file=sys.stderr)
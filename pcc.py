@@ -3,9 +3,16 @@
 # **** PlayCode to C transpiler ****
 
 import os
+import re
 import sys
+import time
+from contextlib import contextmanager
 
-from lark import Lark, Tree, Transformer
+import cache
+import frontend
+import optimizer
+import resolve
+import syntax
 
 COLORS = {
     'header': '\033[95m',
@@ -19,280 +26,1009 @@ COLORS = {
     'underline': '\033[4m',
 }
 
-parser = Lark(open("pc.lark", "r").read(), start="program", parser="lalr")
+# a construct the C back end cannot run the way pc.py does
+class Unsupported(Exception):
+    pass
 
-cout = """"""
-nindents = 2
+# int arithmetic that may leave 64 bits stops with an OverflowError (where
+# pc.py's ints would keep growing) instead of wrapping
+CHECKED = False
 
-has_print = False
+# first pass: static analysis, one walk over the tree (nothing is run) to find
+# what the C program needs, names in order of first assignment, then the kind of
+# every variable and expression: "int", "bool", "float" (from /) or "vector"
+class Analysis(object):
+    def __init__(self):
+        self.names = {}     # assigned name -> kind
+        self.vectors = {}   # vector name -> largest literal assigned to it
+        self.tags = {}      # tag -> definitions (bodies) in source order
+        self.calls = {}     # tag -> number of call sites
+        self.kinds = {}     # id(expression) -> kind
+        self.ranges = {}    # id(int expression) -> (lowest, highest) it may be, as python computes it
+        self.small = set()  # int names whose values all fit 32 bits
+        self.unset = set()  # id(read) that may find its variable unset (see resolve.unset)
+        self.flagged = set()# names with such reads, which get a flag set on assignment
+        self.prints = 0
+        self.asserts = 0
 
-# first pass: figure out what magic this playcode program will do
-def visitor(tree):
-    global has_print
-    match tree.data:
-        case "program":
-            for branch in tree.children: visitor(branch)
+def analyze(tree, names=None):
+    analysis = Analysis()
+    # kinds already known, of variables set before `tree` runs
+    analysis.names.update(names or {})
+    # expressions and blocks are emitted as nested C, which compilers (and the
+    # passes here) only take so deep, too deep ones are flattened (see syntax.flatten)
+    syntax.flatten(tree)
+    analysis.unset = resolve.unset(tree, names or ())
+    order, stack = [], [tree]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        if id(node) in analysis.unset: analysis.flagged.add(str(node.children[0]))
+        match node.data:
+            case "assign_stmt":
+                left, right = node.children
+                name = str(left.children[0])
+                analysis.names.setdefault(name, None)
+                if right.data == "vector" and len(left.children) == 1:
+                    analysis.vectors[name] = max(analysis.vectors.get(name, 0), len(right.children))
+            case "swap_stmt":
+                for side in node.children:
+                    analysis.names.setdefault(str(side.children[0]), None)
+            case "taggable":
+                if len(node.children) > 1:
+                    analysis.tags.setdefault(node.children[0].value, []).append(node.children[1])
+            case "tag_stmt":
+                analysis.calls[node.children[0].value] = analysis.calls.get(node.children[0].value, 0) + 1
+            case "print_stmt":
+                analysis.prints += 1
+                if len(node.children) > 1: analysis.asserts += 1
+            case "assert_stmt":
+                analysis.asserts += 1
+        stack.extend(child for child in reversed(node.children) if isinstance(child, syntax.Tree))
+    infer(order, analysis)
+    ranges(tree, analysis, names or {})
+    return analysis
+
+# kinds of variables, a variable is one kind for the whole program: every
+# assignment is worked out once in source order, and again only when a name it
+# reads changes kind (which each name does once), so this stays linear in the
+# program, then the kind of every expression is recorded with the names settled
+def infer(order, analysis):
+    names, kinds = analysis.names, analysis.kinds
+
+    def assign(name, value):
+        if value is None or names[name] == value:
+            return ()
+        if names[name] is not None:
+            raise Unsupported(f"{name} holds both {names[name]} and {value} values")
+        names[name] = value
+        return (name,)
+
+    # kind of an expression, its nodes worked out children first (of a postfix node its leaves)
+    def expression(node):
+        nodes, stack = [], [node]
+        while stack:
+            item = stack.pop()
+            nodes.append(item)
+            if item.data == "postfix":
+                stack.extend(step for step in item.children if step.data in LEAVES)
+            else:
+                stack.extend(child for child in item.children if isinstance(child, syntax.Tree))
+        for item in reversed(nodes):
+            match item.data:
+                case "postfix":
+                    kinds[id(item)] = stacked(item, kinds)[-1]
+                case "number" | "reduction":
+                    kinds[id(item)] = "int"
+                case "true" | "false" | "eq" | "neq" | "lt" | "gt":
+                    kinds[id(item)] = "bool"
+                case "identifier":
+                    kinds[id(item)] = "int" if len(item.children) > 1 else names.get(str(item.children[0]), "int")
+                case "add" | "sub" | "mul":
+                    operands = (kinds[id(item.children[0])], kinds[id(item.children[1])])
+                    kinds[id(item)] = "vector" if "vector" in operands else None if None in operands else "int"
+                case "div":
+                    kinds[id(item)] = "float"
+                case "vector":
+                    kinds[id(item)] = "vector"
+        return kinds.get(id(node))
+
+    # names whose kind changed by running the assignment or swap `node`
+    def update(node):
+        if node.data == "assign_stmt":
+            left, right = node.children
+            return assign(str(left.children[0]), "vector" if len(left.children) > 1 else expression(right))
+        left, right = (str(side.children[0]) for side in node.children)
+        changed = ()
+        for side in node.children:
+            if len(side.children) > 1: changed += assign(str(side.children[0]), "vector")
+        if len(node.children[0].children) == 1 and len(node.children[1].children) == 1:
+            changed += assign(left, names[right]) + assign(right, names[left])
+        return changed
+
+    # assignments and swaps in source order, and the ones reading each name
+    writes, readers = [node for node in order if node.data in ("assign_stmt", "swap_stmt")], {}
+    for number, node in enumerate(writes):
+        stack = list(node.children[1:] if node.data == "assign_stmt" else node.children)
+        while stack:
+            item = stack.pop()
+            if item.data == "identifier": readers.setdefault(str(item.children[0]), []).append(number)
+            stack.extend(child for child in item.children if isinstance(child, syntax.Tree))
+
+    pending = list(reversed(range(len(writes))))
+    queued = set(pending)
+    while True:
+        while pending:
+            number = pending.pop()
+            queued.discard(number)
+            for name in update(writes[number]):
+                for reader in readers.get(name, ()):
+                    if reader not in queued:
+                        queued.add(reader)
+                        pending.append(reader)
+        # names only assigned from each other, int like a name that is never assigned
+        unknown = [name for name in names if names[name] is None]
+        if not unknown:
+            break
+        for name in unknown:
+            names[name] = "int"
+            for reader in readers.get(name, ()):
+                if reader not in queued:
+                    queued.add(reader)
+                    pending.append(reader)
+    expression(order[0])
+
+LEAVES = {"number", "true", "false", "identifier"}
+
+# kind of the value on top of the stack after each step of a postfix node (see
+# syntax.postfix), the kinds of its leaves known
+def stacked(node, kinds):
+    stack, after = [], []
+    for step in node.children:
+        match step.data:
+            case "number" | "true" | "false" | "identifier":
+                stack.append(kinds[id(step)])
+            case "element" | "reduction":
+                stack[-1] = "int"
+            case "int":
+                pass
+            case "div":
+                stack.pop()
+                stack[-1] = "float"
+            case "eq" | "neq" | "lt" | "gt":
+                stack.pop()
+                stack[-1] = "bool"
+            case _:
+                operands = (stack.pop(), stack[-1])
+                stack[-1] = "vector" if "vector" in operands else None if None in operands else "int"
+        after.append(stack[-1])
+    return after
+
+# then the values every int variable and expression may take, walking the
+# program in order with an interval per variable, both branches of an if
+# joined, a loop run to a fixpoint (bounds that still grow after two rounds
+# widened to infinite, then narrowed by one more round under its condition)
+# and a second walk, on those loop invariants, recording the ranges, a
+# variable whose values fit 32 bits is declared int, arithmetic that may
+# leave 64 bits is checked with --checked (and wraps otherwise)
+def ranges(tree, analysis, seeded):
+    names, found = analysis.names, analysis.ranges
+    # tag targets change wherever a tag is called, they are never narrowed
+    tagged = {str(body.children[0].children[0]) for bodies in analysis.tags.values() for body in bodies if len(body.children[0].children) == 1}
+    # variables start out 0 in main, unknown when passed in
+    start = {name: INT64 if name in seeded or name in tagged else (0, 0) for name, kind in names.items() if kind == "int"}
+    held = dict(start)
+    invariants = {}     # id(loop) -> state at the top of its body
+    recording = False
+
+    def note(node, value):
+        if recording and value is not None:
+            found[id(node)] = join(found[id(node)], value) if id(node) in found else value
+        return value
+
+    def value(node, state):
+        match node.data:
+            case "number":
+                try:
+                    return note(node, bounded(int(node.children[0]), int(node.children[0])))
+                except ValueError:
+                    return None
+            case "true":
+                return note(node, (1, 1))
+            case "false":
+                return note(node, (0, 0))
+            case "identifier":
+                if len(node.children) > 1:
+                    value(node.children[1], state)
+                    return note(node, INT64)
+                match names.get(str(node.children[0]), "int"):
+                    case "int":
+                        return note(node, state.get(str(node.children[0]), (0, 0)))
+                    case "bool":
+                        return note(node, (0, 1))
+                    case "float":
+                        # through int(), in C a cast to long long
+                        return note(node, INT64)
+                return None
+            case "add" | "sub" | "mul":
+                left, right = value(node.children[0], state), value(node.children[1], state)
+                if left is None or right is None:
+                    return None
+                if node.data == "add":
+                    exact = bounded(left[0] + right[0], left[1] + right[1])
+                elif node.data == "sub":
+                    exact = bounded(left[0] - right[1], left[1] - right[0])
+                else:
+                    products = [product(a, b) for a in left for b in right]
+                    exact = bounded(min(products), max(products))
+                note(node, exact)
+                # checked or wrapped, what C goes on with is 64 bits
+                return exact if within(exact, INT64) else INT64
+            case "div":
+                value(node.children[0], state)
+                value(node.children[1], state)
+                return None
+            case "eq" | "neq" | "lt" | "gt":
+                value(node.children[0], state)
+                value(node.children[1], state)
+                return note(node, (0, 1))
+            case "vector":
+                for item in node.children: value(item, state)
+                return None
+            case "reduction":
+                value(node.children[1], state)
+                return note(node, (0, INT64[1]) if str(node.children[0]) == "len" else INT64)
+
+    # state where `condition` is `truth`, None if it cannot be
+    def refine(state, condition, truth):
+        if state is None:
+            return None
+        state = dict(state)
+        if condition.data not in ("eq", "neq", "lt", "gt"):
+            return state
+        left, right = condition.children
+        for name, other, op in ((integer(left), right, condition.data), (integer(right), left, FLIPPED[condition.data])):
+            if name is None:
+                continue
+            bound = value(other, state)
+            if bound is None:
+                continue
+            lowest, highest = state[name]
+            match op if truth else NEGATED[op]:
+                case "lt":
+                    highest = min(highest, bound[1] - 1)
+                case "le":
+                    highest = min(highest, bound[1])
+                case "gt":
+                    lowest = max(lowest, bound[0] + 1)
+                case "ge":
+                    lowest = max(lowest, bound[0])
+                case "eq":
+                    lowest, highest = max(lowest, bound[0]), min(highest, bound[1])
+            if lowest > highest:
+                return None
+            state[name] = (lowest, highest)
+        return state
+
+    # an int variable read as it is
+    def integer(node):
+        if node.data == "identifier" and len(node.children) == 1 and names.get(str(node.children[0])) == "int":
+            return str(node.children[0])
+        return None
+
+    def hold(state, name, range):
+        if name in state:
+            state[name] = range if range is not None else INT64
+            if recording: held[name] = join(held[name], state[name])
+
+    # the state after `node`, which may change `state`
+    def run(node, state):
+        if state is None:
+            return None
+        match node.data:
+            case "program":
+                for branch in node.children: state = run(branch, state)
+            case "taggable":
+                if len(node.children) == 1:
+                    state = run(node.children[0], state)
+            case "assign_stmt":
+                left, right = node.children
+                result = value(right, state)
+                if len(left.children) > 1:
+                    value(left.children[1], state)
+                else:
+                    hold(state, str(left.children[0]), result)
+            case "tag_stmt":
+                for body in analysis.tags.get(node.children[0].value, []):
+                    left, right = body.children
+                    value(right, state)
+                    if len(left.children) > 1: value(left.children[1], state)
+                    else: hold(state, str(left.children[0]), INT64)
+            case "swap_stmt":
+                left, right = node.children
+                sides = []
+                for side in node.children:
+                    if len(side.children) > 1:
+                        value(side.children[1], state)
+                        sides.append(INT64)
+                    else:
+                        sides.append(state.get(str(side.children[0])))
+                hold(state, str(left.children[0]), sides[1])
+                hold(state, str(right.children[0]), sides[0])
+            case "if_stmt":
+                condition = node.children[0]
+                value(condition, state)
+                then = refine(state, condition, True)
+                if len(node.children) > 1: then = run(node.children[1], then)
+                otherwise = refine(state, condition, False)
+                if len(node.children) > 2: otherwise = run(node.children[2], otherwise)
+                state = merge(then, otherwise)
+            case "while_stmt":
+                condition = node.children[0]
+                if not recording or id(node) not in invariants:
+                    invariants[id(node)] = loop(node, state)
+                top = invariants[id(node)]
+                if recording:
+                    value(condition, top)
+                    if len(node.children) > 1: run(node.children[1], refine(top, condition, True))
+                state = refine(top, condition, False)
+            case "assert_stmt" | "print_stmt":
+                value(node.children[0], state)
+            case "linear":
+                # steps run in any order, every int variable may hold anything in them
+                state = {name: INT64 for name in state}
+                for step in node.children:
+                    if step.data == "branch": value(step.children[0], state)
+                    elif step.data != "jump": run(step, dict(state))
+                if recording:
+                    for name in state: held[name] = INT64
+        return state
+
+    # state at the top of a loop, for every round
+    def loop(node, entry):
+        condition, rounds, top = node.children[0], 0, entry
+        while True:
+            state = refine(top, condition, True)
+            if len(node.children) > 1: state = run(node.children[1], state)
+            state = merge(entry, state)
+            if all(top[name][0] <= state[name][0] and state[name][1] <= top[name][1] for name in top):
+                # the last round, bounded by the condition again, is the invariant
+                return state
+            rounds += 1
+            if rounds > 2:
+                state = {name: (top[name][0] if state[name][0] >= top[name][0] else -INF,
+                                top[name][1] if state[name][1] <= top[name][1] else INF) for name in top}
+            top = state
+
+    run(tree, dict(start))
+    recording = True
+    run(tree, dict(start))
+    analysis.small = {name for name, range in held.items() if within(range, INT32)}
+
+INT32 = (-2**31, 2**31 - 1)
+INT64 = (-2**63, 2**63 - 1)
+INF = float("inf")
+
+# a op b as b FLIPPED[op] a, and not (a op b) as a NEGATED[op] b
+FLIPPED = {"eq": "eq", "neq": "neq", "lt": "gt", "gt": "lt"}
+NEGATED = {"eq": "neq", "neq": "eq", "lt": "ge", "gt": "le"}
+
+# bounds far past 64 bits only matter as past them
+def bounded(lowest, highest):
+    return (-INF if lowest < -2**64 else lowest, INF if highest > 2**64 else highest)
+
+def product(a, b):
+    return 0 if a == 0 or b == 0 else a * b
+
+def within(range, bounds):
+    return range is not None and bounds[0] <= range[0] and range[1] <= bounds[1]
+
+def join(a, b):
+    return (min(a[0], b[0]), max(a[1], b[1]))
+
+# states of two paths joined, None is a path never taken
+def merge(a, b):
+    if a is None or b is None:
+        return a if b is None else b
+    return {name: join(a[name], b[name]) for name in a}
+
+# C output is collected as fragments and joined once, so emitting is linear in
+# output size, `with out.block():` indents the lines written inside
+class Emitter:
+    def __init__(self, indent="  "):
+        self.indent = indent
+        self.parts = []
+        self.depth = 0
+
+    def write(self, *parts):
+        self.parts.extend(parts)
+
+    def line(self, *parts):
+        self.write(self.indent * self.depth, *parts, "\n")
+
+    @contextmanager
+    def block(self):
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+# second pass: perform the magic in C, a program's main or (given a name) a
+# function running `tree` on variables passed in
+def codegen(tree, analysis, out, function=None, checked=False):
+    names, kinds = analysis.names, analysis.kinds
+    widths = {}
+    # nodes made for postfix steps, kept alive so their ids stay theirs
+    made = []
+
+    def statement(node):
+        match node.data:
+            case "program":
+                for branch in node.children: statement(branch)
+            case "taggable":
+                if len(node.children) > 1:
+                    # a definition only picks the body later calls run
+                    name, body = node.children
+                    number = next(number for number, other in enumerate(analysis.tags[name.value], 1) if other is body)
+                    out.line(f"{tag(name.value)} = {number};")
+                else:
+                    statement(node.children[0])
+            case "assign_stmt":
+                left, right = node.children
+                if len(left.children) > 1: check(left)
+                out.write(out.indent * out.depth)
+                if len(left.children) > 1:
+                    element(right)
+                    place(left, True)
+                else:
+                    out.write(variable(str(left.children[0])))
+                out.write(" = ")
+                expression(right)
+                out.write(";\n")
+                if len(left.children) == 1 and str(left.children[0]) in analysis.flagged:
+                    out.line(f"{flag(str(left.children[0]))} = 1;")
+            case "tag_stmt":
+                # calls are inlined, with the definition that ran last picked at runtime
+                name = node.children[0].value
+                definitions = analysis.tags.get(name, [])
+                fail = f"pc_fail({literal(f'KeyError: {name!r}')});"
+                if not definitions:
+                    out.line(fail)
+                elif len(definitions) == 1:
+                    out.line(f"if ({tag(name)} != 1) {fail}")
+                    statement(definitions[0])
+                else:
+                    out.line(f"switch ({tag(name)}) {{")
+                    for number, body in enumerate(definitions, 1):
+                        out.line(f"case {number}:")
+                        with out.block():
+                            statement(body)
+                            out.line("break;")
+                    out.line("default:")
+                    with out.block():
+                        out.line(fail)
+                    out.line("}")
+            case "swap_stmt":
+                left, right = node.children
+                if len(left.children) > 1 and len(right.children) > 1:
+                    kind = "int"
+                elif len(left.children) > 1 or len(right.children) > 1:
+                    kind = names[str((right if len(left.children) > 1 else left).children[0])]
+                    if kind != "int":
+                        raise Unsupported(f"swap of a vector element with {kind} values")
+                else:
+                    kind = names[str(left.children[0])]
+                for side in node.children: check(side)
+                out.line("{")
+                with out.block():
+                    out.write(out.indent * out.depth, declaration(kind, "tmp"), " = ")
+                    place(left, False)
+                    out.write(";\n", out.indent * out.depth)
+                    place(left, True)
+                    out.write(" = ")
+                    place(right, False)
+                    out.write(";\n", out.indent * out.depth)
+                    place(right, True)
+                    out.write(" = tmp;\n")
+                out.line("}")
+            case "if_stmt":
+                out.write(out.indent * out.depth, "if (")
+                condition(node.children[0])
+                out.write(") {\n")
+                with out.block():
+                    if len(node.children) > 1: statement(node.children[1])
+                if len(node.children) > 2:
+                    out.line("} else {")
+                    with out.block():
+                        statement(node.children[2])
+                out.line("}")
+            case "while_stmt":
+                out.write(out.indent * out.depth, "while (")
+                condition(node.children[0])
+                out.write(") {\n")
+                with out.block():
+                    if len(node.children) > 1: statement(node.children[1])
+                out.line("}")
+            case "linear":
+                # branches and jumps go to labels numbered by the step they are at
+                prefix = f"l{len(made)}_"
+                made.append(node)
+                targets = {step.children[-1] for step in node.children if step.data in ("branch", "jump")}
+                for number, step in enumerate(node.children):
+                    if number in targets: out.line(f"{prefix}{number}:;")
+                    match step.data:
+                        case "branch":
+                            out.write(out.indent * out.depth, "if (!(")
+                            condition(step.children[0])
+                            out.write(f")) goto {prefix}{step.children[1]};\n")
+                        case "jump":
+                            out.line(f"goto {prefix}{step.children[0]};")
+                        case _:
+                            statement(step)
+                if len(node.children) in targets: out.line(f"{prefix}{len(node.children)}:;")
+            case "assert_stmt":
+                value, expected = node.children
+                out.write(out.indent * out.depth, f"pc_assert({TEXT[kinds[id(value)]]}(")
+                expression(value)
+                out.write(f"), {literal(expected.children[0])});\n")
+            case "print_stmt":
+                value = node.children[0]
+                if len(node.children) > 1:
+                    out.write(out.indent * out.depth, f"pc_print_assert({TEXT[kinds[id(value)]]}(")
+                    expression(value)
+                    out.write(f"), {literal(node.children[1].children[0])});\n")
+                elif kinds[id(value)] == "int":
+                    out.write(out.indent * out.depth, "printf(\"%lld\\n\", " if wide(value) else "printf(\"%d\\n\", ")
+                    expression(value)
+                    out.write(");\n")
+                else:
+                    out.write(out.indent * out.depth, f"puts({TEXT[kinds[id(value)]]}(")
+                    expression(value)
+                    out.write("));\n")
+
+    # C for an expression, fully parenthesised (the grammar nests a - b - c as a - (b - c))
+    def expression(node):
+        match node.data:
+            case "number":
+                try:
+                    value = int(node.children[0])
+                except ValueError:
+                    raise Unsupported(f"{node.children[0]} is not an integer")
+                if not -2**63 < value < 2**63:
+                    raise Unsupported(f"{value} does not fit in 64 bits")
+                out.write(str(value))
+            case "true":
+                out.write("1")
+            case "false":
+                out.write("0")
+            case "identifier":
+                name = str(node.children[0])
+                if name not in names:
+                    out.write(f"(pc_fail({literal(f'KeyError: {name!r}')}), 0)")
+                elif len(node.children) > 1:
+                    # read through int() like every index in pc.py but those of stores and swaps
+                    if names[name] != "vector":
+                        raise Unsupported(f"{name} is indexed but holds {names[name]} values")
+                    out.write(guard(node), f"pc_get({variable(name)}, ")
+                    scalar(node.children[1])
+                    out.write(")", ")" if guard(node) else "")
+                else:
+                    out.write(guard(node), variable(name), ")" if guard(node) else "")
+            case "add" | "sub" | "mul" if kinds[id(node)] == "vector":
+                out.write(f"pc_vector_binary('{OPERATORS[node.data]}', ")
+                operand(node.children[0])
+                out.write(", ")
+                operand(node.children[1])
+                out.write(")")
+            case "div":
+                if "vector" in (kinds[id(node.children[0])], kinds[id(node.children[1])]):
+                    raise Unsupported("/ on a vector gives floats, C vectors hold ints only")
+                out.write("pc_div(")
+                scalar(node.children[0])
+                out.write(", ")
+                scalar(node.children[1])
+                out.write(")")
+            case "add" | "sub" | "mul" if checked and not within(analysis.ranges.get(id(node)), INT64):
+                out.write(f"pc_{node.data}(")
+                scalar(node.children[0])
+                out.write(", ")
+                scalar(node.children[1])
+                out.write(")")
+            case op if op in OPERATORS:
+                out.write("(")
+                # int operands whose result may not fit int are widened first
+                if op in ("add", "sub", "mul") and wide(node) and not (wide(node.children[0]) or wide(node.children[1])):
+                    out.write("(long long)")
+                scalar(node.children[0])
+                out.write(f" {OPERATORS[op]} ")
+                scalar(node.children[1])
+                out.write(")")
+            case "vector":
+                if not node.children:
+                    out.write("pc_vector_new(0)")
+                    return
+                out.write(f"pc_vector_of({len(node.children)}, (long long[]){{")
+                for number, item in enumerate(node.children):
+                    if number: out.write(", ")
+                    element(item)
+                    expression(item)
+                out.write("})")
+            case "reduction":
+                name, value = node.children
+                if str(name) not in REDUCTIONS:
+                    raise Unsupported(f"unknown reduction {name}")
+                if kinds[id(value)] != "vector":
+                    raise Unsupported(f"{name} of {kinds[id(value)]} values")
+                out.write(f"{REDUCTIONS[str(name)]}(")
+                expression(value)
+                out.write(")")
+            case "temporary":
+                out.write(node.children[0])
+            case "postfix":
+                postfix(node)
+
+    # a flattened expression as a (GNU) statement expression, each step into a
+    # temporary of its own, operators written by `expression` on the temporaries
+    # their operands are in
+    def postfix(node):
+        out.write("({ ")
+        stack = []
+        for step, kind in zip(node.children, stacked(node, kinds)):
+            match step.data:
+                case "number" | "true" | "false" | "identifier":
+                    value = step
+                case "element":
+                    value = syntax.Tree("identifier", [step.children[0], stack.pop()])
+                    if id(step) in analysis.unset: analysis.unset.add(id(value))
+                case "reduction":
+                    value = syntax.Tree("reduction", [step.children[0], stack.pop()])
+                case "int":
+                    # comparisons put their operands through int() as they write them
+                    continue
+                case _:
+                    right = stack.pop()
+                    value = syntax.Tree(step.data, [stack.pop(), right])
+            temporary = syntax.Tree("temporary", [f"p{len(made)}"])
+            made.extend((value, temporary))
+            kinds[id(value)] = kinds[id(temporary)] = kind
+            out.write(declaration(kind, temporary.children[0]), " = ")
+            expression(value)
+            out.write("; ")
+            stack.append(temporary)
+        out.write(f"{stack[-1].children[0]}; }})")
+
+    # whether C has an int expression as long long (else int)
+    def wide(node):
+        if id(node) not in widths:
+            match node.data:
+                case _ if kinds[id(node)] == "float":
+                    widths[id(node)] = True
+                case "number":
+                    widths[id(node)] = not within(analysis.ranges.get(id(node)), INT32)
+                case "identifier":
+                    widths[id(node)] = len(node.children) > 1 or (names.get(str(node.children[0])) == "int" and str(node.children[0]) not in analysis.small)
+                case "add" | "sub" | "mul":
+                    widths[id(node)] = not within(analysis.ranges.get(id(node)), INT32) or wide(node.children[0]) or wide(node.children[1])
+                case "reduction" | "temporary" | "postfix":
+                    # temporaries holding ints are long long
+                    widths[id(node)] = True
+                case _:
+                    widths[id(node)] = False
+        return widths[id(node)]
+
+    # operand as an int, pc.py puts every arithmetic and comparison operand through int()
+    def scalar(node):
+        if kinds[id(node)] == "vector":
+            raise Unsupported("vector where pc.py takes a number")
+        if kinds[id(node)] == "float":
+            out.write("((long long)")
+            expression(node)
+            out.write(")")
+        else:
+            expression(node)
+
+    # operand of elementwise arithmetic, the vector or NULL and the number
+    def operand(node):
+        if kinds[id(node)] == "vector":
+            expression(node)
+            out.write(", 0")
+        else:
+            out.write("NULL, ")
+            scalar(node)
+
+    # C vectors hold ints, pc.py would keep anything else in a list that prints it differently
+    def element(node):
+        if kinds[id(node)] != "int":
+            raise Unsupported(f"vector element of {kinds[id(node)]} values")
+
+    # a vector element or variable, in a swap or store (raw index, as in pc.py)
+    def place(node, store):
+        name = str(node.children[0])
+        if len(node.children) == 1:
+            out.write(variable(name))
             return
-        case "taggable":
+        if names[name] != "vector":
+            raise Unsupported(f"{name} is indexed but holds {names[name]} values")
+        if kinds[id(node.children[1])] not in ("int", "bool"):
+            raise Unsupported(f"index of {kinds[id(node.children[1])]} values")
+        out.write("*pc_set(" if store else "pc_get(", variable(name), ", ")
+        expression(node.children[1])
+        out.write(")")
+
+    # C opening a read of the variable of an identifier node that may be unset,
+    # failing like pc.py's lookup before the rest (closed by a parenthesis) runs
+    def guard(node):
+        name = str(node.children[0])
+        if id(node) not in analysis.unset:
+            return ""
+        return f"({flag(name)} || (pc_fail({literal(f'KeyError: {name!r}')}), 0), "
+
+    # a statement failing if the variable a store or swap side reads may be unset and is
+    def check(node):
+        name = str(node.children[0])
+        if id(node) in analysis.unset:
+            out.line(f"if (!{flag(name)}) pc_fail({literal(f'KeyError: {name!r}')});")
+
+    def condition(node):
+        expression(node)
+        if kinds[id(node)] == "vector": out.write("->len != 0")
+        elif kinds[id(node)] == "float": out.write(" != 0")
+
+    if checked: out.write("#define PC_CHECKED\n")
+    if function is not None: out.write("#define PC_UNDO\n")
+    with open(RUNTIME, "r") as f: out.write(f.read(), "\n")
+    if function is None:
+        out.write("int main() {\n")
+        with out.block():
+            # declare variables
+            for name, kind in names.items():
+                out.line(declaration("small" if name in analysis.small else kind, variable(name)), " = NULL;" if kind == "vector" else " = 0;")
+            for name in analysis.tags: out.line(f"int {tag(name)} = 0;")
+            # whether a variable that may be read unset is set yet
+            for name in names:
+                if name in analysis.flagged: out.line(f"int {flag(name)} = 0;")
+            statement(tree)
+            out.write("\n")
+            out.line("return pc_failures != 0;")
+        out.write("}\n")
+        return
+    # a function for pc.py to call running the loop `tree`: variables come in by
+    # pointer and go back out, vectors are shared in place, an error returns -1
+    # with its message in *error and the variables as the iteration it stopped
+    # in began: each one starts by passing them out (and forgetting the elements
+    # the one before stored), the elements it stored are put back
+    parameters = ["const char **error"] + [declaration(kind, f"a_{name}" if kind == "vector" else f"*a_{name}") for name, kind in names.items()]
+    out.write(f"int {function}({', '.join(parameters)}) {{\n")
+    with out.block():
+        out.line("jmp_buf trap;")
+        for name, kind in names.items(): out.line(declaration(kind, variable(name)), f" = a_{name};" if kind == "vector" else f" = *a_{name};")
+        for name in analysis.tags: out.line(f"int {tag(name)} = 0;")
+        out.line("if (setjmp(trap)) {")
+        with out.block():
+            out.line("pc_catch = NULL;")
+            out.line("pc_undo();")
+            out.line("*error = pc_error;")
+            out.line("return -1;")
+        out.line("}")
+        out.line("pc_catch = &trap;")
+        out.line("while (1) {")
+        with out.block():
+            for name, kind in names.items():
+                if kind != "vector": out.line(f"*a_{name} = {variable(name)};")
+            out.line("pc_undo_len = 0;")
+            out.write(out.indent * out.depth, "if (!(")
+            condition(tree.children[0])
+            out.write(")) break;\n")
+            if len(tree.children) > 1: statement(tree.children[1])
+        out.line("}")
+        out.line("pc_catch = NULL;")
+        for name, kind in names.items():
+            if kind != "vector": out.line(f"*a_{name} = {variable(name)};")
+        out.line("return 0;")
+    out.write("}\n")
+
+RUNTIME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime.c")
+
+# C type of each kind (and of an int whose values fit 32 bits) and the runtime
+# function giving its text, as str() does in pc.py
+TYPES = {"small": "int", "int": "long long", "bool": "int", "float": "double", "vector": "pc_vector *"}
+TEXT = {"int": "pc_int_text", "bool": "pc_bool_text", "float": "pc_float_text", "vector": "pc_vector_text"}
+
+OPERATORS = {"add": "+", "sub": "-", "mul": "*", "eq": "==", "neq": "!=", "lt": "<", "gt": ">"}
+
+REDUCTIONS = {"sum": "pc_sum", "min": "pc_min", "max": "pc_max", "len": "pc_len"}
+
+# program names get a prefix, so they never meet C keywords or the runtime
+def variable(name):
+    return f"v_{name}"
+
+def tag(name):
+    return f"t_{name[1:]}"
+
+def flag(name):
+    return f"s_{name}"
+
+def declaration(kind, name):
+    return f"{TYPES[kind]}{name}" if TYPES[kind].endswith("*") else f"{TYPES[kind]} {name}"
+
+# C string literal with the same bytes as `text`
+def literal(text):
+    return '"' + "".join(chr(byte) if 32 <= byte < 127 and chr(byte) not in '\\"?' else f"\\{byte:03o}" for byte in text.encode()) + '"'
+
+# C for a program, from the cache when the same source was translated before
+def translate(source):
+    name = f"c-{cache.key(cache.sources(*frontend.SOURCES, 'optimizer.py', 'resolve.py', 'pcc.py', 'runtime.c'), frontend.grammar(), frontend.PARSER, optimizer.ENABLED, CHECKED, source)}"
+    c = cache.load(name)
+    if c is None:
+        tree = optimizer.optimize(frontend.parse(source))
+        out = Emitter()
+        codegen(tree, analyze(tree), out, checked=CHECKED)
+        c = out.getvalue()
+        cache.store(name, c)
+    return c
+
+# **** tests ****
+
+# every test is run by pc.py (the reference) and compiled and run natively, the
+# C path passes a test when its output and failed asserts match pc.py's, a test
+# C cannot match (ints past 64 bits wrap here) says why in a line
+# "-- skip pcc.py: <reason>" and is left out
+
+# the reason a test gives for leaving out the C path, or None
+def skipped(source):
+    match = re.search(r"^-- skip pcc\.py: (.+)$", source, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+# compile and run one translated test, in a worker thread
+def native_test(c, profile, timeout):
+    import native
+    import subprocess
+    start = time.perf_counter()
+    with native.binary(c, profile) as path:
+        built = time.perf_counter()
+        try:
+            result = subprocess.run([path], capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return dict(status="Timeout", compile=built - start, run=timeout, stdout=[], stderr=[f"timed out after {timeout:g} s"])
+        ran = time.perf_counter()
+    stderr = result.stderr.splitlines()
+    # anything but failed asserts (exit status 1) is the program stopping on an error
+    if result.returncode not in (0, 1) or any(not line.startswith("Assert error: ") for line in stderr):
+        return dict(status="Error", compile=built - start, run=ran - built, stdout=result.stdout.splitlines(),
+                    stderr=stderr or [f"exited with code {result.returncode}"])
+    return dict(status="OK", compile=built - start, run=ran - built, stdout=result.stdout.splitlines(), stderr=stderr)
+
+def compare(reference, result):
+    # a test stopping on the error it declares (see runner.raises) has the C stop on it too, after the same output
+    if reference["error"] is not None and reference["status"] != "Error":
+        if result["status"] == "OK":
+            return "Mismatch", [f"did not raise {reference['error']} like pc.py"]
+        if result["status"] == "Error" and result["stderr"][-1:] == [reference["error"]]:
+            result = dict(result, status="OK", stderr=result["stderr"][:-1])
+    if result["status"] != "OK":
+        return result["status"], result["stderr"]
+    if reference["status"] not in ("OK", "Failed"):
+        return "Error", [f"pc.py: {error}" for error in reference["stderr"]]
+    differences = []
+    if result["stdout"] != reference["stdout"]:
+        differences.append(f"output {result['stdout']} differs from pc.py {reference['stdout']}")
+    if result["stderr"] != reference["stderr"]:
+        differences.append(f"asserts {result['stderr']} differ from pc.py {reference['stderr']}")
+    if differences:
+        return "Mismatch", differences
+    return ("Failed" if result["stderr"] else "OK"), result["stderr"]
+
+def run_tests(argv):
+    import runner
+    from concurrent.futures import ThreadPoolExecutor
+    import pc
+    option = lambda name, default: next((arg.split("=", 1)[1] for arg in argv if arg.startswith(f"--{name}=")), default)
+    jobs = int(option("jobs", 0)) or os.cpu_count() or 1
+    timeout = float(option("test-timeout", 10))
+    profile = option("build", "O2")
+    print(f"{COLORS['cyan']}Running tests{COLORS['end']}")
+    start = time.perf_counter()
+    tests = runner.discover()
+    # forks, so it runs before any worker thread is started
+    references = runner.run_tests(tests, pc.capture, jobs, timeout)
+    passed = skips = 0
+    with ThreadPoolExecutor(jobs) as pool:
+        results = []
+        for test, reference in zip(tests, references):
             try:
-                if tree.children[0].type == "TAG":
-                    TAG_TABLE[tree.children[0].value] = tree.children[1]
-            except:
-                return visitor(tree.children[0])
-        case "assign_stmt":
-            left, right = tree.children
-            if not left.children[0].value in SYMBOL_TABLE:
-                SYMBOL_TABLE[left.children[0].value] = {}
-            if len(left.children) > 1: visitor(left.children[1])
-            visitor(right)
-        case "tag_stmt":
-            return visitor(TAG_TABLE[tree.children[0].value])
-        case "swap_stmt":
-            left, right = tree.children
-            if len(left.children) > 1 and len(right.children) > 1:
-                visitor(left.children[1])
-                visitor(right.children[1])
-            elif len(left.children) > 1:
-                visitor(left.children[1])
-            elif len(right.children) > 1:
-                visitor(right.children[1])
-        case "if_stmt":
-            if bool(visitor(tree.children[0])):
-                return visitor(tree.children[1])
-            elif len(tree.children) > 2:
-                return visitor(tree.children[2])
-        case "while_stmt":
-            while visitor(tree.children[0]):
-                visitor(tree.children[1])
-        case "assert_stmt":
-            value = str(visitor(tree.children[0]))
-            # TODO convert to appropriate C syntax
-            # if not value == tree.children[1].children[0][1:-1]:
-            #     STDERR.append(f"Assert error: {value} not equal to {tree.children[1].children[0][1:-1]}")
-        case "print_stmt":
-            has_print = True # to include stdio
-            # output = str(visitor(tree.children[0]))
-            # if len(tree.children) > 1 and tree.children[1].data == "assert":
-            #     if not output == tree.children[1].children[0][1:-1]:
-            #         STDERR.append(f"Assert error: {output} not equal to {tree.children[1].children[0][1:-1]}")
-            # STDOUT.append(output)
-        case "comparison":
-            return visitor(tree.children[0])
-        case "expr":
-            return visitor(tree.children[0])
-        case "term":
-            return visitor(tree.children[0])
-        case "factor":
-            return visitor(tree.children[0])
-        case "add":
-            left, right = tree.children
-            visitor(left)
-            visitor(right)
-            return
-        case "sub":
-            left, right = tree.children
-            visitor(left)
-            visitor(right)
-            return
-        case "mul":
-            left, right = tree.children
-            visitor(left)
-            visitor(right)
-            return
-        case "div":
-            left, right = tree.children
-            visitor(left)
-            visitor(right)
-            return
-        case "eq":
-            left, right = tree.children
-            visitor(left)
-            visitor(right)
-            return
-        case "neq":
-            left, right = tree.children
-            visitor(left)
-            visitor(right)
-            return
-        case "lt":
-            left, right = tree.children
-            visitor(left)
-            visitor(right)
-            return
-        case "gt":
-            left, right = tree.children
-            visitor(left)
-            visitor(right)
-            return
-        case "vector":
-            data = []
-            for branch in tree.children:
-                visitor(branch)
-            return
-        case "number":
-            return
-        case "identifier":
-            if len(tree.children) > 1:
-                visitor(tree.children[1])
-                return
-        case "true":
-            return True
-        case "false":
-            return False
-
-# second pass: perform the magic in C
-def codegen(tree):
-    global cout, nindents
-    match tree.data:
-        case "program":
-            for branch in tree.children: codegen(branch)
-            return
-        case "taggable":
+                with open(test, "r") as f: source = f.read()
+                if skipped(source) is not None or reference["status"] == "Skipped":
+                    reason = skipped(source) or f"pc.py skipped it, {reference['stderr'][0]}"
+                    results.append(dict(status="Skipped", compile=0.0, run=0.0, stdout=[], stderr=[reason]))
+                    continue
+                c = translate(source)
+                results.append(pool.submit(native_test, c, profile, timeout))
+            except Unsupported as e:
+                results.append(dict(status="Unsupported", compile=0.0, run=0.0, stdout=[], stderr=[f"Cannot compile: {e}"]))
+            except Exception as e:
+                # a test the front end rejects fails on its own, as in pc.py's runner
+                results.append(dict(status="Error", compile=0.0, run=0.0, stdout=[], stderr=[f"{type(e).__name__}: {e}"]))
+        # reported in path order as they finish
+        for test, reference, result in zip(tests, references, results):
             try:
-                if tree.children[0].type == "TAG":
-                    TAG_TABLE[tree.children[0].value] = tree.children[1]
-            except:
-                return codegen(tree.children[0])
-        case "assign_stmt":
-            left, right = tree.children
-            if len(left.children) > 1:
-                SYMBOL_TABLE[left.children[0].value][visitor(left.children[1])] = visitor(right)
-            else:
-                SYMBOL_TABLE[left.children[0].value] = visitor(right)
-            cout = cout + " "*nindents + f"{left.children[0].value} = "
-            codegen(right)
-            cout = cout + ";\n"
-        case "tag_stmt":
-            return codegen(TAG_TABLE[tree.children[0].value])
-        case "if_stmt":
-            cout = cout + " "*nindents + "if ("
-            codegen(tree.children[0])
-            cout = cout + ") {\n"
-            nindents += 2
-            codegen(tree.children[1])
-            nindents -= 2
-            cout = cout + " "*nindents + "}"
-            if len(tree.children) > 2:
-                cout = cout + " else {\n"
-                nindents += 2
-                codegen(tree.children[2])
-                nindents -= 2
-                cout = cout + " "*nindents + "}\n"
-        case "while_stmt":
-            cout = cout + " "*nindents + "while ("
-            codegen(tree.children[0])
-            cout = cout + ") {\n"
-            nindents += 2
-            codegen(tree.children[1])
-            nindents -= 2
-            cout = cout + " "*nindents + "}\n"
-        case "print_stmt":
-            cout = cout + f"  printf(\"%d\\n\", "
-            codegen(tree.children[0])
-            cout = cout + ");\n"
-        case "comparison":
-            return codegen(tree.children[0])
-        case "expr":
-            return codegen(tree.children[0])
-        case "term":
-            return codegen(tree.children[0])
-        case "factor":
-            return codegen(tree.children[0])
-        case "add":
-            left, right = tree.children
-            codegen(left)
-            cout = cout + " + "
-            codegen(right)
-        case "sub":
-            left, right = tree.children
-            codegen(left)
-            cout = cout + " - "
-            codegen(right)
-        case "mul":
-            left, right = tree.children
-            codegen(left)
-            cout = cout + " * "
-            codegen(right)
-        case "div":
-            left, right = tree.children
-            codegen(left)
-            cout = cout + " / "
-            codegen(right)
-        case "eq":
-            left, right = tree.children
-            codegen(left)
-            cout = cout + " == "
-            codegen(right)
-        case "neq":
-            left, right = tree.children
-            codegen(left)
-            cout = cout + " != "
-            codegen(right)
-        case "lt":
-            left, right = tree.children
-            codegen(left)
-            cout = cout + " < "
-            codegen(right)
-        case "gt":
-            left, right = tree.children
-            codegen(left)
-            cout = cout + " > "
-            codegen(right)
-        case "number":
-            cout = cout + f"{tree.children[0]}"
-        case "identifier":
-            cout = cout + f"{str(tree.children[0])}" if str(tree.children[0]) in SYMBOL_TABLE else '0'
-        case "true":
-            cout = cout + "1"
-        case "false":
-            cout = cout + "0"
+                result = result if isinstance(result, dict) else result.result()
+            except Exception as e:
+                result = dict(status="Error", compile=0.0, run=0.0, stdout=[], stderr=[f"{type(e).__name__}: {e}"])
+            if result["status"] == "Skipped":
+                skips += 1
+                print(f"  {test} {COLORS['warning']}Skipped{COLORS['end']} {result['stderr'][0]}")
+                continue
+            status, errors = compare(reference, result)
+            passed += status == "OK"
+            color = COLORS['green'] if status == "OK" else COLORS['fail']
+            speedup = f"{reference['time'] / result['run']:.1f}x" if status in ("OK", "Failed") and result["run"] > 0 else "-"
+            print(f"  {test} {color}{status}{COLORS['end']} compile {result['compile'] * 1000:.1f} ms, "
+                  f"run {result['run'] * 1000:.1f} ms, pc.py {reference['time'] * 1000:.1f} ms, speedup {speedup}")
+            for error in enumerate(errors, 1):
+                print(f"    {COLORS['fail']}{error[0]} - {error[1]}{COLORS['end']}")
+    print(f"{COLORS['cyan']}Done, {passed}/{len(tests) - skips} match pc.py{f', {skips} skipped' if skips else ''} "
+          f"in {time.perf_counter() - start:.2f} s{COLORS['end']}")
+    return passed == len(tests) - skips
 
 # **** main ****
 if (__name__ == "__main__"):
-    # TODO python3 pcc.py --tests
+    # python3 pcc.py <file> --no-cache
+    cache.ENABLED = "--no-cache" not in sys.argv
+    # python3 pcc.py <file> --no-opt
+    optimizer.ENABLED = "--no-opt" not in sys.argv
+    # python3 pcc.py <file> --parser=lark|handwritten
+    frontend.PARSER = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--parser=")), "lark")
+    # python3 pcc.py <file> --checked
+    CHECKED = "--checked" in sys.argv
+    # python3 pcc.py --tests --jobs=N --test-timeout=S --build=O0|O2|O3|native
     if "--tests" in sys.argv:
-        print(f"{COLORS['cyan']}Running tests{COLORS['end']}")
-        for path, subdirs, files in os.walk("tests"):
-            for name in files:
-                test = os.path.join(path, name)
-                tree = parser.parse(open(test, "r").read())
-                SYMBOL_TABLE = {}
-                TAG_TABLE = {}
-                STDOUT = []
-                STDERR = []
-                for branch in tree.children: visitor(branch)
-                if len(STDERR) == 0:
-                    print(f"  {test} {COLORS['green']}OK{COLORS['end']}")
-                else:
-                    print(f"  {test} {COLORS['fail']}Failed{COLORS['end']}")
-                    for error in enumerate(STDERR, 1):
-                        print(f"    {COLORS['fail']}{error[0]} - {error[1]}{COLORS['end']}")
-        print(f"{COLORS['cyan']}Done{COLORS['end']}")
-    # python3 pcc.py <file> --tables
-    elif len(sys.argv) > 1:
-        file = open(sys.argv[1], "r").read()
-        tree = parser.parse(file)
-        SYMBOL_TABLE = {}
-        TAG_TABLE = {}
-        STDOUT = []
-        STDERR = []
-        # need to get all symbols in first pass to add at top in c output
-        for branch in tree.children: visitor(branch)
-        if not len(STDOUT) == 0:
-            for output in STDOUT: print(output)
+        if not run_tests(sys.argv): sys.exit(1)
+    # python3 pcc.py <file> --target=python --emit=<file>
+    elif len(sys.argv) > 1 and "--target=python" in sys.argv:
+        import output
+        import pysource
+        file = open(next(arg for arg in sys.argv[1:] if not arg.startswith("--")), "r").read()
+        emit = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--emit=")), None)
+        if emit:
+            with open(emit, "w") as f: f.write(pysource.transpile(file))
+        stream, STDERR, TAGS, SYMBOLS = output.Stream(sys.stdout), [], {}, {}
+        try:
+            pysource.run(pysource.compile_source(file), stream, STDERR, TAGS, SYMBOLS)
+        finally:
+            stream.flush()
+        for line in STDERR: print(line, file=sys.stderr)
         if "--tables" in sys.argv:
-            print(f"{COLORS['warning']}SYMBOL_TABLE: {SYMBOL_TABLE}{COLORS['end']}")
-            print(f"{COLORS['warning']}TAG_TABLE: {TAG_TABLE}{COLORS['end']}")
-        # c codegen
-        cout = "#include <stdio.h>\n\n" if has_print else ""
-        cout = cout + """int main() {\n"""
-        # declare variables
-        for key in SYMBOL_TABLE: cout = cout + f"  int {key};\n"
-        for branch in tree.children: codegen(branch)
-        cout = cout + """\n  return 0;\n}"""
-        # compile and run cout using gcc
-        with open("out.c", "w") as f: f.write(cout)
-        os.system("gcc -o out out.c")
-        os.system("./out")
+            print(f"{COLORS['warning']}SYMBOL_TABLE: {SYMBOLS}{COLORS['end']}")
+            print(f"{COLORS['warning']}TAG_TABLE: {TAGS}{COLORS['end']}")
+        sys.exit(1 if STDERR else 0)
+    # python3 pcc.py <file> --tables --build=O0|O2|O3|native --emit=<file>
+    elif len(sys.argv) > 1:
+        file = open(next(arg for arg in sys.argv[1:] if not arg.startswith("--")), "r").read()
+        try:
+            if "--tables" in sys.argv:
+                analysis = analyze(optimizer.optimize(frontend.parse(file)))
+                print(f"{COLORS['warning']}SYMBOL_TABLE: {analysis.names}{COLORS['end']}")
+                print(f"{COLORS['warning']}TAG_TABLE: {analysis.tags}{COLORS['end']}")
+            c = translate(file)
+        except Unsupported as e:
+            print(f"{COLORS['fail']}Cannot compile: {e}{COLORS['end']}", file=sys.stderr)
+            sys.exit(1)
+        emit = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--emit=")), None)
+        if emit:
+            with open(emit, "w") as f: f.write(c)
+        # compile (or reuse the cached binary) and run, exiting with its status
+        import native
+        try:
+            with native.binary(c, next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--build=")), "O2")) as path:
+                sys.stdout.flush()
+                status = native.run(path)
+        except native.BuildError as e:
+            print(f"{COLORS['fail']}Build failed: {e}{COLORS['end']}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(status)
     else:
         print(f"{COLORS['fail']}No source file provided{COLORS['end']}")
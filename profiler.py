@@ -0,0 +1,82 @@
+# **** PlayCode profiler ****
+
+# per-statement profile for the tree walker, pc.py rebinds its visitor to the
+# wrapper returned by Profile.wrap for the run, so every node passes through
+# it while profiling and the walker is untouched otherwise, recorded per
+# source position:
+#   statements       every statement run
+#   while iteration  every run of a while body
+#   tag body         every call of a tag, at the tag definition
+
+import json
+import time
+
+from syntax import STATEMENTS, Tree
+
+COLORS = {
+    'cyan': '\033[96m',
+    'warning': '\033[93m',
+    'end': '\033[0m',
+}
+
+class Profile:
+    def __init__(self, source):
+        self.lines = source.splitlines()
+        # (line, column, kind) -> [hits, cumulative, self]
+        self.stats = {}
+
+    # node id -> stats entry for every node worth timing
+    def entries(self, tree):
+        entries = {}
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if node.data in STATEMENTS:
+                entries[id(node)] = self.stats.setdefault((node.line, node.column, node.data), [0, 0.0, 0.0])
+                if node.data == "while_stmt" and len(node.children) > 1:
+                    entries[id(node.children[1])] = self.stats.setdefault((node.line, node.column, "while iteration"), [0, 0.0, 0.0])
+                if node.data == "taggable" and isinstance(node.children[0], str):
+                    entries[id(node.children[1])] = self.stats.setdefault((node.line, node.column, "tag body"), [0, 0.0, 0.0])
+            stack.extend(child for child in node.children if isinstance(child, Tree))
+        return entries
+
+    def wrap(self, tree, visit):
+        entries = self.entries(tree)
+        # time spent in timed children of each open entry, to get self time
+        children = [0.0]
+        clock = time.perf_counter
+        def visitor(tree):
+            entry = entries.get(id(tree))
+            if entry is None:
+                return visit(tree)
+            children.append(0.0)
+            start = clock()
+            try:
+                return visit(tree)
+            finally:
+                elapsed = clock() - start
+                inner = children.pop()
+                children[-1] += elapsed
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += elapsed - inner
+        return visitor
+
+    def rows(self):
+        rows = [dict(line=line, column=column, kind=kind, hits=hits, cumulative=cumulative, self=own,
+                     source=self.lines[line - 1].strip() if line and line <= len(self.lines) else "")
+                for (line, column, kind), (hits, cumulative, own) in self.stats.items() if hits]
+        return sorted(rows, key=lambda row: row["self"], reverse=True)
+
+    def report(self, top=20):
+        rows = self.rows()
+        total = sum(row["self"] for row in rows) or 1.0
+        print(f"{COLORS['cyan']}Profile, {total * 1000:.1f} ms in statements (top {min(top, len(rows))} by self time){COLORS['end']}")
+        print(f"  {'line:col':<9} {'kind':<16} {'hits':>9} {'cumulative':>12} {'self':>11} {'self %':>7}  source")
+        for row in rows[:top]:
+            print(f"  {row['line']}:{row['column']:<{8 - len(str(row['line']))}} {row['kind']:<16} {row['hits']:>9} "
+                  f"{row['cumulative'] * 1000:9.2f} ms {row['self'] * 1000:8.2f} ms {row['self'] / total:7.1%}  {row['source'][:40]}")
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(dict(unit="seconds", statements=self.rows()), f, indent=2)
@@ -0,0 +1,488 @@
+# **** PlayCode to Python transpiler ****
+
+# translates a program into the source of one python function whose locals are
+# the program's variables (v_<name>), with real while and if, tags as nested
+# functions (a definition stores the function in TAG_TABLE, so a call runs the
+# latest one and an undefined tag is a KeyError, as in the walker),
+# prints appending to STDOUT and asserts to STDERR, then compiles it once, the
+# code object is cached (marshal, as in a .pyc) next to the vm bytecode
+#
+# the walker puts every arithmetic and comparison operand through int(), here
+# that only happens where an operand may be a float (ints and bools give the
+# same results without it), and arithmetic goes through a helper only where an
+# operand may be a vector, vectors are plain lists (as with --vectors=list) so
+# a store never has to widen one
+#
+# with a budget, the end of every loop body and the start of every tag count a
+# step of it (budget.py) on a local copy of its countdown, the variables go into
+# SYMBOLS however the program ends
+
+import re
+import sys
+
+import cache
+import frontend
+import optimizer
+import syntax
+import vectors
+from pcc import Emitter
+
+# as the walker does it, results of the vector fallback made plain lists
+def listed(value):
+    return value.tolist() if type(value) in vectors.TYPED else value
+
+def add(left, right):
+    try:
+        return int(left) + int(right)
+    except TypeError:
+        return listed(vectors.binary("add", left, right))
+
+def sub(left, right):
+    try:
+        return int(left) - int(right)
+    except TypeError:
+        return listed(vectors.binary("sub", left, right))
+
+def mul(left, right):
+    try:
+        return int(left) * int(right)
+    except TypeError:
+        return listed(vectors.binary("mul", left, right))
+
+def div(left, right):
+    try:
+        return int(left) / int(right)
+    except TypeError:
+        return listed(vectors.binary("div", left, right))
+
+# int() of an operand that may be a vector, a list here, failing as the walker's vectors do
+def number(value):
+    if type(value) is list:
+        raise TypeError("vector is not a number")
+    return int(value)
+
+# python compiles at most 20 nested loops (and 100 levels of indentation) in a
+# function, so blocks nested deeper than this run as a syntax.linear node
+BLOCKS = 16
+
+OPERATORS = {"add": "+", "sub": "-", "mul": "*", "div": "/", "eq": "==", "neq": "!=", "lt": "<", "gt": ">"}
+
+# what a variable, expression or vector element may hold: (may be float, may
+# be vector), every flag only ever turns on, so each statement (or condition) is
+# worked out once in source order and again only when something it reads
+# changes, which keeps this linear in the program
+def kinds(tree):
+    names, element = {}, [False, False]
+    # what each flag list belongs to (a name, or None for vector elements), and
+    # what turned on since the last look
+    owner, changed = {id(element): None}, set()
+
+    def name(text):
+        if text not in names:
+            names[text] = [False, False]
+            owner[id(names[text])] = text
+        return names[text]
+
+    def join(target, value):
+        for i in (0, 1):
+            if value[i] and not target[i]:
+                target[i] = True
+                changed.add(owner[id(target)])
+
+    def expression(node):
+        match node.data:
+            case "identifier":
+                if len(node.children) > 1:
+                    expression(node.children[1])
+                    return element
+                return name(str(node.children[0]))
+            case "add" | "sub" | "mul":
+                left, right = expression(node.children[0]), expression(node.children[1])
+                return [False, left[1] or right[1]]
+            case "div":
+                left, right = expression(node.children[0]), expression(node.children[1])
+                # a vector / gives a list of floats
+                if left[1] or right[1]: join(element, [True, False])
+                return [True, left[1] or right[1]]
+            case "vector":
+                for item in node.children: join(element, expression(item))
+                return [False, True]
+            case "reduction":
+                expression(node.children[1])
+            case "postfix":
+                values = []
+                for step in node.children:
+                    match step.data:
+                        case "add" | "sub" | "mul" | "div":
+                            right, left = values.pop(), values.pop()
+                            if step.data == "div" and (left[1] or right[1]): join(element, [True, False])
+                            values.append([step.data == "div", left[1] or right[1]])
+                        case "eq" | "neq" | "lt" | "gt":
+                            values.pop()
+                            values[-1] = [False, False]
+                        case "int" | "reduction":
+                            values[-1] = [False, False]
+                        case "element":
+                            values[-1] = element
+                        case _:
+                            values.append(expression(step))
+                return values[0]
+        return [False, False]
+
+    def update(node):
+        match node.data:
+            case "assign_stmt":
+                left, right = node.children
+                target = name(str(left.children[0]))
+                value = expression(right)
+                if len(left.children) > 1:
+                    expression(left.children[1])
+                    join(target, [False, True])
+                    join(element, value)
+                else:
+                    join(target, value)
+            case "swap_stmt":
+                sides = [name(str(side.children[0])) for side in node.children]
+                values = [element if len(side.children) > 1 else sides[i] for i, side in enumerate(node.children)]
+                for i, side in enumerate(node.children):
+                    if len(side.children) > 1: join(sides[i], [False, True])
+                join(values[0], list(values[1]))
+                join(values[1], list(values[0]))
+            case _:
+                expression(node)
+
+    # assignments, swaps and conditions or printed values in source order, and the ones reading each name
+    items, stack = [], [tree]
+    while stack:
+        node = stack.pop()
+        match node.data:
+            case "assign_stmt" | "swap_stmt":
+                items.append(node)
+                continue
+            case "if_stmt" | "while_stmt" | "print_stmt" | "assert_stmt" | "branch":
+                items.append(node.children[0])
+        stack.extend(child for child in reversed(node.children) if isinstance(child, syntax.Tree))
+    readers = {}
+    for number, item in enumerate(items):
+        stack = [item]
+        while stack:
+            node = stack.pop()
+            if node.data == "identifier":
+                readers.setdefault(str(node.children[0]) if len(node.children) == 1 else None, set()).add(number)
+            elif node.data == "element":
+                readers.setdefault(None, set()).add(number)
+            stack.extend(child for child in node.children if isinstance(child, syntax.Tree))
+
+    pending = list(reversed(range(len(items))))
+    queued = set(pending)
+    while pending:
+        number = pending.pop()
+        queued.discard(number)
+        update(items[number])
+        for key in changed:
+            for reader in readers.get(key, ()):
+                if reader not in queued:
+                    queued.add(reader)
+                    pending.append(reader)
+        changed.clear()
+    return names, element
+
+def translate(tree, budget=False):
+    # expressions too deep to compile by recursion become postfix nodes, blocks too deep linear ones
+    tree = syntax.flatten(tree, blocks=BLOCKS)
+    names, element = kinds(tree)
+    out = Emitter(indent="    ")
+    # variables a tag assigns, the program has to bind them too for nonlocal
+    tagged = set()
+    # variables in order of first assignment, for --tables
+    order = []
+
+    known = {}
+
+    def kind(node):
+        if id(node) not in known:
+            match node.data:
+                case "identifier":
+                    known[id(node)] = element if len(node.children) > 1 else names.get(str(node.children[0]), [False, False])
+                case "add" | "sub" | "mul":
+                    known[id(node)] = [False, kind(node.children[0])[1] or kind(node.children[1])[1]]
+                case "div":
+                    known[id(node)] = [True, kind(node.children[0])[1] or kind(node.children[1])[1]]
+                case "vector":
+                    known[id(node)] = [False, True]
+                case "postfix":
+                    known[id(node)] = pushed(node.children)[-1]
+                case _:
+                    known[id(node)] = [False, False]
+        return known[id(node)]
+
+    # what each step of a postfix node pushes
+    def pushed(steps):
+        values, kinds = [], []
+        for step in steps:
+            match step.data:
+                case "add" | "sub" | "mul" | "div":
+                    right, left = values.pop(), values.pop()
+                    values.append([step.data == "div", left[1] or right[1]])
+                case "eq" | "neq" | "lt" | "gt":
+                    values.pop()
+                    values[-1] = [False, False]
+                case "int" | "reduction":
+                    values[-1] = [False, False]
+                case "element":
+                    values[-1] = element
+                case _:
+                    values.append(kind(step))
+            kinds.append(values[-1])
+        return kinds
+
+    def expression(node):
+        match node.data:
+            case "number":
+                # an int since lowering, unless int() rejects the literal (1.5), which fails when it runs
+                if type(node.children[0]) is not int:
+                    return f"int({str(node.children[0])!r})"
+                return str(node.children[0])
+            case "true":
+                return "True"
+            case "false":
+                return "False"
+            case "identifier":
+                name = f"v_{node.children[0]}"
+                if len(node.children) > 1:
+                    return f"{name}[{operand(node.children[1], kind(node.children[1])[1])}]"
+                return name
+            case "add" | "sub" | "mul" | "div" if kind(node.children[0])[1] or kind(node.children[1])[1]:
+                return f"{node.data}({expression(node.children[0])}, {expression(node.children[1])})"
+            case op if op in OPERATORS:
+                # int() raises on a vector in a comparison, as in the walker
+                vector = op not in ("add", "sub", "mul", "div")
+                return f"({operand(node.children[0], vector)} {OPERATORS[op]} {operand(node.children[1], vector)})"
+            case "vector":
+                return "[" + ", ".join(expression(item) for item in node.children) + "]"
+            case "reduction":
+                return f"reduce({str(node.children[0])!r}, {expression(node.children[1])})"
+            case "postfix":
+                return f"{flattened(node.children)}()"
+
+    # int() of an operand, left out where it changes nothing
+    def operand(node, vector=False):
+        may = kind(node)
+        if vector and may[1]:
+            return f"number({expression(node)})"
+        if may[0]:
+            return f"int({expression(node)})"
+        return expression(node)
+
+    # a function defined here computing a postfix node, its steps one statement
+    # each on locals s0, s1, .. (the stack), so no python source nests deeply
+    functions = []
+    def flattened(steps):
+        name = f"e_{len(functions)}"
+        functions.append(name)
+        out.line(f"def {name}():")
+        with out.block():
+            # kinds of what is on the stack
+            held = []
+            for step, may in zip(steps, pushed(steps)):
+                top = len(held) - 1
+                match step.data:
+                    case "add" | "sub" | "mul" | "div" if may[1]:
+                        out.line(f"s{top - 1} = {step.data}(s{top - 1}, s{top})")
+                        del held[-2:]
+                    case op if op in OPERATORS:
+                        # int() where it changes something, as operand() does
+                        vector = op not in ("add", "sub", "mul", "div")
+                        left, right = (f"number(s{i})" if vector and held[i][1] else f"int(s{i})" if held[i][0] else f"s{i}"
+                                       for i in (top - 1, top))
+                        out.line(f"s{top - 1} = {left} {OPERATORS[op]} {right}")
+                        del held[-2:]
+                    case "int":
+                        if held[top][1]: out.line(f"s{top} = number(s{top})")
+                        elif held[top][0]: out.line(f"s{top} = int(s{top})")
+                        held.pop()
+                    case "element":
+                        index = f"number(s{top})" if held[top][1] else f"int(s{top})" if held[top][0] else f"s{top}"
+                        out.line(f"s{top} = v_{step.children[0]}[{index}]")
+                        held.pop()
+                    case "reduction":
+                        out.line(f"s{top} = reduce({str(step.children[0])!r}, s{top})")
+                        held.pop()
+                    case _:
+                        out.line(f"s{top + 1} = {expression(step)}")
+                held.append(may)
+            out.line("return s0")
+        return name
+
+    # a variable or element being written, the index is used as it is (no int()), as in the walker
+    def place(node):
+        if str(node.children[0]) not in order: order.append(str(node.children[0]))
+        if len(node.children) > 1:
+            return f"v_{node.children[0]}[{expression(node.children[1])}]"
+        return f"v_{node.children[0]}"
+
+    def tick():
+        out.line("fuel -= 1")
+        out.line("if fuel < 0: fuel = BUDGET.refill()")
+
+    def check(text, expected):
+        out.line(f"if {text} != {expected!r}:")
+        with out.block():
+            out.line(f"STDERR.append(\"Assert error: \" + {text} + \" not equal to \" + {expected!r})")
+
+    def statement(node):
+        match node.data:
+            case "program":
+                if not node.children: out.line("pass")
+                for branch in node.children: statement(branch)
+            case "taggable":
+                if len(node.children) > 1:
+                    name, body = node.children
+                    target = f"v_{body.children[0].children[0]}"
+                    out.line(f"def t_{name[1:]}():")
+                    with out.block():
+                        if len(body.children[0].children) == 1:
+                            tagged.add(target)
+                            out.line(f"nonlocal {target}")
+                        if budget:
+                            out.line("nonlocal fuel")
+                            tick()
+                        statement(body)
+                    out.line(f"TAGS[{str(name)!r}] = t_{name[1:]}")
+                else:
+                    statement(node.children[0])
+            case "assign_stmt":
+                out.line(place(node.children[0]), " = ", expression(node.children[1]))
+            case "tag_stmt":
+                out.line(f"TAGS[{str(node.children[0])!r}]()")
+            case "swap_stmt":
+                left, right = (place(side) for side in node.children)
+                out.line(f"{left}, {right} = {right}, {left}")
+            case "if_stmt":
+                out.line(f"if {expression(node.children[0])}:")
+                with out.block():
+                    if len(node.children) > 1: statement(node.children[1])
+                    else: out.line("pass")
+                if len(node.children) > 2:
+                    out.line("else:")
+                    with out.block():
+                        statement(node.children[2])
+            case "while_stmt":
+                out.line(f"while {expression(node.children[0])}:")
+                with out.block():
+                    if len(node.children) > 1: statement(node.children[1])
+                    # the walker fails on a loop without a body
+                    else: out.line("raise IndexError(\"list index out of range\")")
+                    if budget: tick()
+            case "assert_stmt":
+                value, expected = node.children
+                out.line(f"text = str({expression(value)})")
+                check("text", expected.children[0])
+            case "print_stmt":
+                if len(node.children) > 1:
+                    out.line(f"text = str({expression(node.children[0])})")
+                    check("text", node.children[1].children[0])
+                    out.line("append(text)")
+                else:
+                    out.line(f"append(str({expression(node.children[0])}))")
+            case "linear":
+                # a loop over the blocks of the steps, picked by the step they start at
+                # through nested ifs (as deep as log2 of their number)
+                steps = node.children
+                starts = {0, len(steps)}
+                for number, step in enumerate(steps):
+                    if step.data in ("branch", "jump"): starts.update((number + 1, step.children[-1]))
+                starts = sorted(starts)
+                out.line("at = 0")
+                out.line("while True:")
+                with out.block():
+                    dispatch(steps, starts, 0, len(starts))
+
+    # the blocks starts[low] up to starts[high]
+    def dispatch(steps, starts, low, high):
+        if high - low > 1:
+            middle = (low + high) // 2
+            out.line(f"if at < {starts[middle]}:")
+            with out.block():
+                dispatch(steps, starts, low, middle)
+            out.line("else:")
+            with out.block():
+                dispatch(steps, starts, middle, high)
+            return
+        if starts[low] == len(steps):
+            out.line("break")
+            return
+        for number in range(starts[low], starts[low + 1]):
+            step = steps[number]
+            match step.data:
+                case "branch":
+                    out.line(f"at = {number + 1} if {expression(step.children[0])} else {step.children[1]}")
+                case "jump":
+                    # a jump back is a loop back edge
+                    if budget and step.children[0] <= number: tick()
+                    out.line(f"at = {step.children[0]}")
+                case _:
+                    statement(step)
+        if steps[starts[low + 1] - 1].data not in ("branch", "jump"):
+            out.line(f"at = {starts[low + 1]}")
+
+    out.line("def program(STDOUT, STDERR, TAGS, SYMBOLS, BUDGET):")
+    with out.block():
+        out.line("append = STDOUT.append")
+        if budget: out.line("fuel = BUDGET.left")
+        out.line("try:")
+        with out.block():
+            statement(tree)
+        # the variables, for --tables
+        out.line("finally:")
+        with out.block():
+            out.line("variables = locals()")
+            out.line(f"SYMBOLS.update({{name: variables[\"v_\" + name] for name in {tuple(order)!r} if \"v_\" + name in variables}})")
+        out.line("return")
+        # never runs, binds names only tags assign (nonlocal needs a binding here)
+        unbound = sorted(name for name in tagged if not bound(tree, name[2:]))
+        if unbound: out.line(" = ".join(unbound), " = None")
+    return out.getvalue()
+
+# whether `name` is assigned (or swapped) anywhere outside a tag definition
+def bound(tree, name):
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.data == "taggable" and len(node.children) > 1:
+            continue
+        if node.data == "assign_stmt" and len(node.children[0].children) == 1 and str(node.children[0].children[0]) == name:
+            return True
+        if node.data == "swap_stmt" and any(len(side.children) == 1 and str(side.children[0]) == name for side in node.children):
+            return True
+        stack.extend(child for child in node.children if isinstance(child, syntax.Tree))
+    return False
+
+# python source for a program
+def transpile(source, budget=False):
+    return translate(optimizer.optimize(frontend.parse(source)), budget)
+
+# code object for a program, from the cache when the same source was compiled by this python before
+def compile_source(source, budget=False):
+    name = f"py-{cache.key(cache.sources(*frontend.SOURCES, 'optimizer.py', 'pysource.py', 'pcc.py'), frontend.grammar(), frontend.PARSER, optimizer.ENABLED, sys.version, budget, source)}"
+    code = cache.load(name)
+    if code is None:
+        code = compile(transpile(source, budget), "<playcode>", "exec")
+        cache.store(name, code)
+    return code
+
+NAMESPACE = dict(add=add, sub=sub, mul=mul, div=div, number=number, reduce=vectors.reduce)
+
+# runs a compiled program, its variables go in SYMBOLS and its tags in TAGS
+def run(code, STDOUT, STDERR, TAGS, SYMBOLS, budget=None):
+    namespace = dict(NAMESPACE)
+    exec(code, namespace)
+    try:
+        namespace["program"](STDOUT, STDERR, TAGS, SYMBOLS, budget)
+    except NameError as e:
+        # a variable read before anything was assigned to it (NameError,
+        # UnboundLocalError, or a free variable in a tag), the walker's KeyError
+        name = re.search(r"'v_(\w+)'", str(e))
+        if name is None:
+            raise
+        raise KeyError(name.group(1)) from None
@@ -0,0 +1,121 @@
+# **** PlayCode REPL ****
+
+# runs statements as they are typed, on the tree engine, with the parser built
+# once and SYMBOL_TABLE and TAG_TABLE kept between inputs, lines are collected
+# until they parse as a whole program (lark's interactive parser says whether
+# the input may end there), so an open { or a trailing operator asks for more
+#
+#   :tables       print SYMBOL_TABLE and TAG_TABLE
+#   :time         toggle printing parse and run time of every input
+#   :load <file>  run a file against the current tables
+#   :quit         leave (as does end of input)
+#
+# an if runs as soon as its } is typed, so an else goes on the same line
+
+import sys
+import time
+
+import frontend
+
+COLORS = {
+    'cyan': '\033[96m',
+    'warning': '\033[93m',
+    'fail': '\033[91m',
+    'end': '\033[0m',
+}
+
+PROMPT = ">>> "
+MORE = "... "
+
+class Repl:
+    # execute(tree) runs a program against the tables, failed asserts are appended to errors
+    def __init__(self, execute, symbols, tags, errors, stdin=sys.stdin):
+        self.execute = execute
+        self.symbols = symbols
+        self.tags = tags
+        self.errors = errors
+        self.stdin = stdin
+        self.timing = False
+        # prompts only when someone is typing, piped input runs quietly
+        self.interactive = stdin.isatty()
+
+    def read(self, prompt):
+        if self.interactive:
+            return input(prompt)
+        line = self.stdin.readline()
+        if not line:
+            raise EOFError
+        return line.rstrip("\n")
+
+    def loop(self):
+        if self.interactive:
+            try:
+                import readline
+            except ImportError:
+                pass
+            # the first parse pays for building the parser, not the first input
+            frontend.parser()
+        lines = []
+        while True:
+            try:
+                line = self.read(MORE if lines else PROMPT)
+            except EOFError:
+                break
+            except KeyboardInterrupt:
+                # drops an unfinished block
+                print()
+                lines = []
+                continue
+            if not lines and line.strip().startswith(":"):
+                if not self.command(line.strip()):
+                    break
+                continue
+            lines.append(line)
+            start = time.perf_counter()
+            try:
+                tree = frontend.parse_partial("\n".join(lines))
+            except Exception as e:
+                print(f"{COLORS['fail']}Syntax error: {e}{COLORS['end']}", file=sys.stderr)
+                lines = []
+                continue
+            if tree is None:
+                continue
+            lines = []
+            self.run(tree, time.perf_counter() - start)
+
+    def run(self, tree, parsed):
+        start = time.perf_counter()
+        try:
+            self.execute(tree)
+        except Exception as e:
+            # statements before the failing one keep their effect, as in a file
+            print(f"{COLORS['fail']}{type(e).__name__}: {e}{COLORS['end']}", file=sys.stderr)
+        finally:
+            for error in self.errors: print(error, file=sys.stderr)
+            del self.errors[:]
+        if self.timing:
+            print(f"{COLORS['cyan']}parse {parsed * 1000:.2f} ms, run {(time.perf_counter() - start) * 1000:.2f} ms{COLORS['end']}")
+
+    # runs a : command, False to leave
+    def command(self, line):
+        name, _, argument = line.partition(" ")
+        match name:
+            case ":tables":
+                print(f"{COLORS['warning']}SYMBOL_TABLE: {self.symbols}{COLORS['end']}")
+                print(f"{COLORS['warning']}TAG_TABLE: {self.tags}{COLORS['end']}")
+            case ":time":
+                self.timing = not self.timing
+                print(f"{COLORS['cyan']}timing {'on' if self.timing else 'off'}{COLORS['end']}")
+            case ":load":
+                start = time.perf_counter()
+                try:
+                    with open(argument.strip(), "r") as f: tree = frontend.parse(f.read())
+                except Exception as e:
+                    print(f"{COLORS['fail']}{type(e).__name__}: {e}{COLORS['end']}", file=sys.stderr)
+                    return True
+                self.run(tree, time.perf_counter() - start)
+            case ":quit":
+                return False
+            case _:
+                print(f"{COLORS['fail']}Unknown command {name}, expected :tables, :time, :load <file> or :quit{COLORS['end']}", file=sys.stderr)
+        return True
@@ -0,0 +1,94 @@
+# **** PlayCode name resolver ****
+
+# gives every variable in a program a fixed slot index (in order of first
+# appearance), so engines can keep values in a preallocated list instead of
+# hashing names into SYMBOL_TABLE on every access
+
+from syntax import Tree
+
+def resolve(tree):
+    slots = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.data in ("identifier", "element"):
+            slots.setdefault(str(node.children[0]), len(slots))
+        stack.extend(child for child in reversed(node.children) if isinstance(child, Tree))
+    return slots
+
+# reads that may find their variable unset (ids of identifier nodes and of
+# element steps), engines check only these and raise the walker's KeyError: a
+# name is set for certain after an assignment or swap to it, after an if that
+# sets it on both branches, or after a call to a tag whose every definition sets
+# it, not after a loop setting it (the body may not run), and a tag body sees
+# what was set where it is defined (a call can only come after that), with
+# blocks flattened (see syntax.flatten), so this recursion stays shallow, names
+# in `known` are set before `tree` runs
+def unset(tree, known=()):
+    reads = set()
+    # names a call of each tag sets for certain
+    targets = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.data == "taggable" and len(node.children) > 1:
+            left = node.children[1].children[0]
+            name = {str(left.children[0])} if len(left.children) == 1 else set()
+            tag = node.children[0].value
+            targets[tag] = targets[tag] & name if tag in targets else name
+        stack.extend(child for child in node.children if isinstance(child, Tree))
+
+    def read(node, known):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.data in ("identifier", "element") and str(node.children[0]) not in known:
+                reads.add(id(node))
+            stack.extend(child for child in node.children if isinstance(child, Tree))
+
+    # names set for certain after `node` runs with `known` set before
+    def run(node, known):
+        match node.data:
+            case "program":
+                for branch in node.children: known = run(branch, known)
+            case "taggable":
+                if len(node.children) > 1:
+                    run(node.children[1], known)
+                else:
+                    known = run(node.children[0], known)
+            case "assign_stmt":
+                left, right = node.children
+                if len(left.children) > 1:
+                    read(left, known)
+                read(right, known)
+                if len(left.children) == 1:
+                    known = known | {str(left.children[0])}
+            case "swap_stmt":
+                for side in node.children: read(side, known)
+                known = known | {str(side.children[0]) for side in node.children}
+            case "tag_stmt":
+                known = known | targets.get(node.children[0].value, set())
+            case "if_stmt":
+                read(node.children[0], known)
+                if len(node.children) > 1:
+                    then = run(node.children[1], known)
+                    otherwise = run(node.children[2], known) if len(node.children) > 2 else known
+                    known = then & otherwise
+            case "while_stmt":
+                read(node.children[0], known)
+                if len(node.children) > 1: run(node.children[1], known)
+            case "assert_stmt" | "print_stmt":
+                read(node.children[0], known)
+            case "linear":
+                # jumps leave no blocks to follow, every step only counts on what was set before
+                for step in node.children:
+                    if step.data == "branch": read(step.children[0], known)
+                    else: run(step, known)
+        return known
+
+    run(tree, frozenset(known))
+    return reads
+
+# rebuild the name -> value view of a frame for --tables, unset slots are None
+def tables(slots, frame):
+    return {name: frame[slot] for name, slot in slots.items() if frame[slot] is not None}
@@ -0,0 +1,160 @@
+# **** PlayCode test runner ****
+
+# runs every test in its own forked process, so each one starts from fresh
+# interpreter state and a hanging or crashing test can be killed without taking
+# the run down, up to `jobs` tests at a time with results reported in path order
+
+import json
+import multiprocessing
+import os
+import re
+import time
+from multiprocessing.connection import wait
+
+COLORS = {
+    'cyan': '\033[96m',
+    'green': '\033[92m',
+    'warning': '\033[93m',
+    'fail': '\033[91m',
+    'end': '\033[0m',
+}
+
+def discover(root="tests"):
+    tests = []
+    for path, subdirs, files in os.walk(root):
+        tests.extend(os.path.join(path, name) for name in files if name.endswith(".pc"))
+    return sorted(tests)
+
+# the error a test says it stops on, with a line "-- raises <error>" (as the
+# runner prints it, e.g. -- raises KeyError: 'x'), or None
+def raises(source):
+    match = re.search(r"^-- raises (.+)$", source, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+# the vector backend a test runs with, with a line "-- vectors <backend>" (see
+# vectors.BACKENDS), or None, a test whose backend cannot be imported is skipped
+def backend(source):
+    match = re.search(r"^-- vectors (\S+)$", source, re.MULTILINE)
+    return match.group(1) if match else None
+
+# execute(source, stdout, stderr) -> (STDOUT, STDERR) runs in the child, printing
+# and asserting into the lists it is given, results go back over the pipe with
+# the error the program stopped on, a test passes on the error it raises
+def child(execute, test, writer):
+    try:
+        with open(test, "r") as f: source = f.read()
+        stdout, stderr, error, expected = [], [], None, raises(source)
+        if backend(source) is not None:
+            import vectors
+            try:
+                vectors.select(backend(source))
+            except ImportError as e:
+                writer.send(("Skipped", [], [f"{type(e).__name__}: {e}"], None))
+                return
+        try:
+            stdout, stderr = execute(source, stdout, stderr)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error is not None and error != expected:
+            writer.send(("Error", list(stdout), list(stderr) + [error], error))
+        elif error is None and expected is not None:
+            writer.send(("Failed", list(stdout), list(stderr) + [f"did not raise {expected}"], None))
+        else:
+            writer.send(("OK" if len(stderr) == 0 else "Failed", list(stdout), list(stderr), error))
+    except BaseException as e:
+        writer.send(("Error", [], [f"{type(e).__name__}: {e}"], None))
+    finally:
+        writer.close()
+
+def run_tests(tests, execute, jobs=None, timeout=10.0, report=None):
+    import frontend
+    context = multiprocessing.get_context("fork")
+    # built once here, every child inherits it instead of building its own on a cache miss
+    if frontend.PARSER == "lark": frontend.parser()
+    jobs = jobs or os.cpu_count() or 1
+    pending = list(enumerate(tests))
+    pending.reverse()
+    running = {}
+    results = [None] * len(tests)
+    reported = 0
+    while pending or running:
+        while pending and len(running) < jobs:
+            index, test = pending.pop()
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(target=child, args=(execute, test, writer), daemon=True)
+            process.start()
+            writer.close()
+            running[reader] = (index, test, process, time.perf_counter())
+        deadline = min(start for (index, test, process, start) in running.values()) + timeout
+        for reader in wait(list(running), max(0.0, deadline - time.perf_counter())):
+            index, test, process, start = running.pop(reader)
+            try:
+                status, stdout, stderr, error = reader.recv()
+            except EOFError:
+                process.join()
+                status, stdout, stderr, error = "Error", [], [f"process exited with code {process.exitcode}"], None
+            process.join()
+            reader.close()
+            results[index] = dict(test=test, status=status, time=time.perf_counter() - start, stdout=stdout, stderr=stderr, error=error)
+        now = time.perf_counter()
+        for reader, (index, test, process, start) in list(running.items()):
+            if now - start >= timeout:
+                process.kill()
+                process.join()
+                reader.close()
+                del running[reader]
+                results[index] = dict(test=test, status="Timeout", time=now - start, stdout=[], stderr=[f"timed out after {timeout:g} s"], error=None)
+        # report finished tests in order as soon as everything before them is done
+        while reported < len(results) and results[reported] is not None:
+            if report: report(results[reported])
+            reported += 1
+    return results
+
+def report(result):
+    color = {"OK": COLORS['green'], "Skipped": COLORS['warning']}.get(result["status"], COLORS['fail'])
+    print(f"  {result['test']} {color}{result['status']}{COLORS['end']} ({result['time'] * 1000:.1f} ms)")
+    if result["status"] == "Skipped":
+        print(f"    {COLORS['warning']}{result['stderr'][0]}{COLORS['end']}")
+        return
+    for error in enumerate(result["stderr"], 1):
+        print(f"    {COLORS['fail']}{error[0]} - {error[1]}{COLORS['end']}")
+
+def write_json(results, path):
+    summary = {status: sum(1 for result in results if result["status"] == status) for status in ("OK", "Failed", "Error", "Timeout", "Skipped")}
+    with open(path, "w") as f:
+        json.dump(dict(tests=[dict((key, result[key]) for key in ("test", "status", "time", "stderr")) for result in results],
+                       summary=summary, time=sum(result["time"] for result in results)), f, indent=2)
+
+def write_junit(results, path):
+    import xml.etree.ElementTree as ET
+    suite = ET.Element("testsuite", name="playcode", tests=str(len(results)),
+                       failures=str(sum(1 for result in results if result["status"] == "Failed")),
+                       errors=str(sum(1 for result in results if result["status"] in ("Error", "Timeout"))),
+                       skipped=str(sum(1 for result in results if result["status"] == "Skipped")),
+                       time=f"{sum(result['time'] for result in results):.3f}")
+    for result in results:
+        case = ET.SubElement(suite, "testcase", classname=os.path.dirname(result["test"]), name=os.path.basename(result["test"]),
+                             time=f"{result['time']:.3f}")
+        if result["status"] == "Skipped":
+            ET.SubElement(case, "skipped", message=result["stderr"][0])
+        elif result["status"] != "OK":
+            kind = "failure" if result["status"] == "Failed" else "error"
+            ET.SubElement(case, kind, message=result["status"]).text = "\n".join(result["stderr"])
+        if result["stdout"]:
+            ET.SubElement(case, "system-out").text = "\n".join(result["stdout"])
+    ET.ElementTree(suite).write(path, encoding="utf-8", xml_declaration=True)
+
+def main(argv, execute):
+    option = lambda name, default: next((arg.split("=", 1)[1] for arg in argv if arg.startswith(f"--{name}=")), default)
+    jobs = int(option("jobs", 0)) or None
+    timeout = float(option("test-timeout", 10))
+    print(f"{COLORS['cyan']}Running tests{COLORS['end']}")
+    start = time.perf_counter()
+    results = run_tests(discover(), execute, jobs, timeout, report)
+    passed = sum(1 for result in results if result["status"] == "OK")
+    skipped = sum(1 for result in results if result["status"] == "Skipped")
+    print(f"{COLORS['cyan']}Done, {passed}/{len(results) - skipped} passed{f', {skipped} skipped' if skipped else ''} "
+          f"in {time.perf_counter() - start:.2f} s{COLORS['end']}")
+    if option("json", None): write_json(results, option("json", None))
+    if option("junit", None): write_junit(results, option("junit", None))
+    return passed == len(results) - skipped
@@ -0,0 +1,249 @@
+/* **** PlayCode C runtime **** */
+
+/* pasted at the top of every program pcc.py generates: int vectors shared by
+   reference like the interpreter's lists, python's negative indices, and the
+   text str() gives in pc.py for print and assert */
+
+#include <math.h>
+#include <setjmp.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+typedef struct {
+    long long len;
+    long long *data;
+} pc_vector;
+
+/* failed asserts, main returns non-zero if there were any */
+static int pc_failures = 0;
+
+/* set while pc.py runs a compiled loop (offload.py), errors jump back to it
+   with the message instead of exiting */
+static jmp_buf *pc_catch = NULL;
+static const char *pc_error = NULL;
+
+/* where pc.py would raise, print the exception and stop */
+static void pc_fail(const char *message) {
+    if (pc_catch != NULL) {
+        pc_error = message;
+        longjmp(*pc_catch, 1);
+    }
+    fflush(stdout);
+    fprintf(stderr, "%s\n", message);
+    exit(1);
+}
+
+#ifdef PC_UNDO
+/* elements stored since the top of the loop iteration running (offload.py)
+   and what they held, put back when it stops on an error, so pc.py can run
+   that iteration again */
+static long long **pc_undo_at = NULL;
+static long long *pc_undo_old = NULL;
+static size_t pc_undo_len = 0, pc_undo_size = 0;
+
+static void pc_undo_note(long long *at) {
+    if (pc_undo_len == pc_undo_size) {
+        size_t size = pc_undo_size ? 2 * pc_undo_size : 64;
+        long long **ats = realloc(pc_undo_at, size * sizeof(long long *));
+        if (ats == NULL) pc_fail("MemoryError");
+        pc_undo_at = ats;
+        long long *olds = realloc(pc_undo_old, size * sizeof(long long));
+        if (olds == NULL) pc_fail("MemoryError");
+        pc_undo_old = olds;
+        pc_undo_size = size;
+    }
+    pc_undo_at[pc_undo_len] = at;
+    pc_undo_old[pc_undo_len++] = *at;
+}
+
+static void pc_undo(void) {
+    while (pc_undo_len > 0) {
+        pc_undo_len--;
+        *pc_undo_at[pc_undo_len] = pc_undo_old[pc_undo_len];
+    }
+}
+#endif
+
+static pc_vector *pc_vector_new(long long len) {
+    pc_vector *v = malloc(sizeof(pc_vector));
+    if (v == NULL) pc_fail("MemoryError");
+    v->len = len;
+    v->data = NULL;
+    if (len > 0 && (v->data = malloc(len * sizeof(long long))) == NULL) pc_fail("MemoryError");
+    return v;
+}
+
+static pc_vector *pc_vector_of(long long len, const long long *items) {
+    pc_vector *v = pc_vector_new(len);
+    memcpy(v->data, items, len * sizeof(long long));
+    return v;
+}
+
+static inline long long pc_get(const pc_vector *v, long long i) {
+    if (i < 0) i += v->len;
+    if (i < 0 || i >= v->len) pc_fail("IndexError: list index out of range");
+    return v->data[i];
+}
+
+static inline long long *pc_set(pc_vector *v, long long i) {
+    if (i < 0) i += v->len;
+    if (i < 0 || i >= v->len) pc_fail("IndexError: list assignment index out of range");
+#ifdef PC_UNDO
+    pc_undo_note(&v->data[i]);
+#endif
+    return &v->data[i];
+}
+
+static inline long long pc_len(const pc_vector *v) {
+    return v->len;
+}
+
+/* int arithmetic that may not fit 64 bits, with PC_CHECKED (pcc.py --checked)
+   it stops there, pc.py's ints would keep growing, otherwise it wraps */
+static inline long long pc_add(long long a, long long b) {
+    long long r;
+    if (__builtin_add_overflow(a, b, &r)) pc_fail("OverflowError: int too large for 64 bits");
+    return r;
+}
+
+static inline long long pc_sub(long long a, long long b) {
+    long long r;
+    if (__builtin_sub_overflow(a, b, &r)) pc_fail("OverflowError: int too large for 64 bits");
+    return r;
+}
+
+static inline long long pc_mul(long long a, long long b) {
+    long long r;
+    if (__builtin_mul_overflow(a, b, &r)) pc_fail("OverflowError: int too large for 64 bits");
+    return r;
+}
+
+#ifdef PC_CHECKED
+#define PC_ADD(a, b) pc_add(a, b)
+#define PC_SUB(a, b) pc_sub(a, b)
+#define PC_MUL(a, b) pc_mul(a, b)
+#else
+#define PC_ADD(a, b) ((a) + (b))
+#define PC_SUB(a, b) ((a) - (b))
+#define PC_MUL(a, b) ((a) * (b))
+#endif
+
+/* elementwise + - *, a NULL vector means that side is the scalar x or y */
+static pc_vector *pc_vector_binary(char op, const pc_vector *a, long long x, const pc_vector *b, long long y) {
+    pc_vector *v;
+    long long i, left, right;
+    if (a != NULL && b != NULL && a->len != b->len) {
+        static char message[96];
+        snprintf(message, sizeof message, "ValueError: vector lengths differ: %lld and %lld", a->len, b->len);
+        pc_fail(message);
+    }
+    v = pc_vector_new(a != NULL ? a->len : b->len);
+    for (i = 0; i < v->len; i++) {
+        left = a != NULL ? a->data[i] : x;
+        right = b != NULL ? b->data[i] : y;
+        v->data[i] = op == '+' ? PC_ADD(left, right) : op == '-' ? PC_SUB(left, right) : PC_MUL(left, right);
+    }
+    return v;
+}
+
+static long long pc_sum(const pc_vector *v) {
+    long long i, total = 0;
+    for (i = 0; i < v->len; i++) total = PC_ADD(total, v->data[i]);
+    return total;
+}
+
+static long long pc_min(const pc_vector *v) {
+    long long i, least;
+    if (v->len == 0) pc_fail("ValueError: min() arg is an empty sequence");
+    for (least = v->data[0], i = 1; i < v->len; i++) if (v->data[i] < least) least = v->data[i];
+    return least;
+}
+
+static long long pc_max(const pc_vector *v) {
+    long long i, most;
+    if (v->len == 0) pc_fail("ValueError: max() arg is an empty sequence");
+    for (most = v->data[0], i = 1; i < v->len; i++) if (v->data[i] > most) most = v->data[i];
+    return most;
+}
+
+/* python's / on two ints */
+static double pc_div(long long a, long long b) {
+    if (b == 0) pc_fail("ZeroDivisionError: division by zero");
+    return (double)a / (double)b;
+}
+
+/* **** text ****
+   each returns a buffer that is only good until its next call */
+
+static const char *pc_int_text(long long x) {
+    static char text[24];
+    snprintf(text, sizeof text, "%lld", x);
+    return text;
+}
+
+static const char *pc_bool_text(int b) {
+    return b ? "True" : "False";
+}
+
+/* repr() of a float: the fewest digits that read back as x, positional for
+   exponents -4 to 15 and scientific otherwise */
+static const char *pc_float_text(double x) {
+    static char text[40];
+    char digits[32], mantissa[20], *c, *out = text;
+    int precision, exponent, n = 0, i;
+    if (isnan(x)) return "nan";
+    if (isinf(x)) return x > 0 ? "inf" : "-inf";
+    for (precision = 1; precision <= 17; precision++) {
+        snprintf(digits, sizeof digits, "%.*e", precision - 1, x);
+        if (strtod(digits, NULL) == x) break;
+    }
+    c = strchr(digits, 'e');
+    exponent = atoi(c + 1);
+    *c = '\0';
+    for (c = digits; *c; c++) if (*c >= '0' && *c <= '9') mantissa[n++] = *c;
+    while (n > 1 && mantissa[n - 1] == '0') n--;
+    mantissa[n] = '\0';
+    if (digits[0] == '-') *out++ = '-';
+    if (exponent >= 16 || exponent < -4) {
+        *out++ = mantissa[0];
+        if (n > 1) out += sprintf(out, ".%s", mantissa + 1);
+        sprintf(out, "e%+03d", exponent);
+    } else if (exponent >= 0) {
+        for (i = 0; i <= exponent; i++) *out++ = i < n ? mantissa[i] : '0';
+        sprintf(out, ".%s", n > exponent + 1 ? mantissa + exponent + 1 : "0");
+    } else {
+        out += sprintf(out, "0.");
+        for (i = 0; i < -exponent - 1; i++) *out++ = '0';
+        sprintf(out, "%s", mantissa);
+    }
+    return text;
+}
+
+static const char *pc_vector_text(const pc_vector *v) {
+    static char *text = NULL;
+    static size_t size = 0;
+    size_t need = 3 + (size_t)v->len * 22, used = 0;
+    long long i;
+    if (need > size) {
+        if ((text = realloc(text, need)) == NULL) pc_fail("MemoryError");
+        size = need;
+    }
+    text[used++] = '[';
+    for (i = 0; i < v->len; i++) used += sprintf(text + used, i ? ", %lld" : "%lld", v->data[i]);
+    text[used++] = ']';
+    text[used] = '\0';
+    return text;
+}
+
+static void pc_assert(const char *text, const char *expected) {
+    if (strcmp(text, expected) != 0) {
+        fprintf(stderr, "Assert error: %s not equal to %s\n", text, expected);
+        pc_failures++;
+    }
+}
+
+static void pc_print_assert(const char *text, const char *expected) {
+    pc_assert(text, expected);
+    puts(text);
+}
@@ -0,0 +1,256 @@
+# **** PlayCode syntax tree ****
+
+# minimal stand-ins for lark's Tree and Token with the same shape (tree.data,
+# tree.children, token.type, token.value), so cached programs can be loaded
+# and run without importing any parser, statements also keep the line and
+# column they start at (used by the profiler), engines run parse trees lowered
+# into these (see lower)
+
+import sys
+
+STATEMENTS = {"taggable", "tag_stmt", "swap_stmt", "if_stmt", "while_stmt", "assert_stmt", "print_stmt"}
+
+class Tree(object):
+    __slots__ = ("data", "children")
+
+    def __init__(self, data, children):
+        self.data = data
+        self.children = children
+
+    def __repr__(self):
+        return f"Tree({self.data!r}, {self.children!r})"
+
+# only statements pay for a position
+class Statement(Tree):
+    __slots__ = ("line", "column")
+
+    def __init__(self, data, children, line=None, column=None):
+        self.data = data
+        self.children = children
+        self.line = line
+        self.column = column
+
+# str subclasses cannot have __slots__, so a token carries a dict, lowering
+# keeps them for tags only
+class Token(str):
+    def __new__(cls, type, value):
+        token = super().__new__(cls, value)
+        token.type = type
+        token.value = value
+        return token
+
+    def __repr__(self):
+        return f"Token({self.type!r}, {self.value!r})"
+
+# lark keeps positions in tree.meta (with propagate_positions), ours on the tree
+def position(tree):
+    meta = getattr(tree, "meta", None)
+    if meta is not None:
+        return (None, None) if meta.empty else (meta.line, meta.column)
+    return tree.line, tree.column
+
+# one flat list of builtins (marshal friendly, and neither side recurses, so an
+# expression any depth deep round-trips), nodes in postorder: tokens are
+# [type, value], names and texts strs and numbers ints (as lowered), trees are
+# (data, number of children) taking that many of the items before them,
+# statements (data, number of children, line, column)
+def encode(tree):
+    data, stack = [], [(tree, False)]
+    while stack:
+        node, done = stack.pop()
+        if type(node) is str or type(node) is int:
+            data.append(node)
+        elif isinstance(node, str):
+            data.append([str(node.type), str(node.value)])
+        elif done:
+            if node.data in STATEMENTS:
+                data.append((str(node.data), len(node.children)) + position(node))
+            else:
+                data.append((str(node.data), len(node.children)))
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+    return data
+
+def decode(data):
+    stack = []
+    for item in data:
+        if type(item) is tuple:
+            children = stack[len(stack) - item[1]:]
+            del stack[len(stack) - item[1]:]
+            data = sys.intern(item[0])
+            stack.append(Statement(data, children, *item[2:]) if len(item) > 2 else Tree(data, children))
+        elif type(item) is list:
+            stack.append(Token(item[0], item[1]))
+        elif type(item) is str:
+            stack.append(sys.intern(item))
+        else:
+            stack.append(item)
+    return stack[0]
+
+# **** lowering ****
+
+# a parse tree (lark's or handparser.py's) as the compact tree the engines run,
+# built bottom-up without recursion, the parse tree is not kept: pass-through
+# nodes (comparison, expr, term, factor) are dropped, names (and node kinds)
+# become interned strs, number literals ints (one int() rejects, like 1.5, stays a token so it
+# fails where it runs, as before), assert strings lose their quotes, and tags
+# stay tokens (pc.py binds every name to one Tag)
+
+PASS_THROUGH = {"comparison", "expr", "term", "factor"}
+
+def lower(tree):
+    # lowered children are the last items on `done` when their parent is reached again
+    done, stack = [], [(tree, False)]
+    while stack:
+        node, ready = stack.pop()
+        if isinstance(node, str):
+            done.append(leaf(node))
+        elif ready:
+            if node.data in PASS_THROUGH:
+                continue
+            children = done[len(done) - len(node.children):]
+            del done[len(done) - len(node.children):]
+            data = sys.intern(str(node.data))
+            if data in STATEMENTS:
+                done.append(Statement(data, children, *position(node)))
+            else:
+                done.append(Tree(data, children))
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+    return done[0]
+
+def leaf(token):
+    match token.type:
+        case "CNAME":
+            return sys.intern(str(token))
+        case "STRING":
+            return str(token)[1:-1]
+        case "SIGNED_NUMBER":
+            try:
+                return int(token)
+            except ValueError:
+                pass
+    return Token(str(token.type), str(token))
+
+# **** postfix ****
+
+# engines evaluate expressions by recursion, a python frame per level of the
+# tree, so flatten replaces every expression taller than DEEP nodes (the
+# grammar nests them as deep as they are long) with a "postfix" node, whose children are
+# the expression's steps in evaluation order: leaves (number, true, false and
+# identifier nodes) push a value, operators (add .. gt) pop two and push one,
+# element (an indexed read, the name as child) and reduction pop one, and int
+# puts the value on top through int(), as a comparison does its left operand
+# before the right one is evaluated, engines run the steps on a stack of values
+
+DEEP = 200
+
+FLATTENED = {"add", "sub", "mul", "div", "eq", "neq", "lt", "gt"}
+COMPARISONS = {"eq", "neq", "lt", "gt"}
+
+INT = Tree("int", [])
+
+def postfix(tree):
+    steps, stack = [], [(tree, False)]
+    while stack:
+        node, done = stack.pop()
+        if done:
+            steps.append(node)
+            continue
+        match node.data:
+            case "identifier" if len(node.children) > 1:
+                stack.append((Tree("element", [node.children[0]]), True))
+                stack.append((node.children[1], False))
+            case "reduction":
+                stack.append((Tree("reduction", [node.children[0]]), True))
+                stack.append((node.children[1], False))
+            case "number" | "true" | "false" | "identifier":
+                steps.append(node)
+            case _:
+                left, right = node.children
+                stack.append((Tree(node.data, []), True))
+                stack.append((right, False))
+                if node.data in COMPARISONS: stack.append((INT, True))
+                stack.append((left, False))
+    return Tree("postfix", steps)
+
+# **** linear ****
+
+# blocks (an if in a while in an if ..) nest engines a few python frames per
+# level too, so flatten also replaces a statement with blocks nested more than
+# BLOCKS deep with a "linear" node, whose children are the statements of all
+# its blocks in the order they are laid out, the blocks taken apart into jumps:
+# branch (a condition and the index of the step to go to when it is false) and
+# jump (the index to go to), every other statement is run as it is, an index
+# past the last step ends the node, engines run the steps with a step counter
+
+BLOCKS = 50
+
+def linear(tree):
+    steps, work = [], [("statement", tree)]
+    while work:
+        kind, node = work.pop()
+        if kind == "here":
+            # a jump (or branch) to the step that comes next
+            node.children[-1] = len(steps)
+        elif kind == "jump":
+            steps.append(node)
+        elif node.data == "program":
+            work.extend(("statement", child) for child in reversed(node.children))
+        elif node.data == "if_stmt" and len(node.children) > 1:
+            # like the walker, children[1] runs on true and children[2] on false
+            branch = Tree("branch", [node.children[0], None])
+            steps.append(branch)
+            if len(node.children) > 2:
+                end = Tree("jump", [None])
+                work += [("here", end), ("statement", node.children[2]), ("here", branch), ("jump", end), ("statement", node.children[1])]
+            else:
+                work += [("here", branch), ("statement", node.children[1])]
+        elif node.data == "while_stmt" and len(node.children) > 1:
+            # the branch is the top of the loop, jumped back to after the body
+            branch = Tree("branch", [node.children[0], None])
+            work += [("here", branch), ("jump", Tree("jump", [len(steps)])), ("statement", node.children[1])]
+            steps.append(branch)
+        else:
+            steps.append(node)
+    return Tree("linear", steps)
+
+# `tree` with its expressions taller than `deep` flattened into postfix nodes,
+# and its statements with blocks nested more than `blocks` deep into linear ones
+def flatten(tree, deep=DEEP, blocks=BLOCKS):
+    # heights and block nesting bottom-up, children come after parents in `order`
+    order, stack = [], [tree]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(child for child in node.children if isinstance(child, Tree))
+    if len(order) <= min(deep, blocks):
+        return tree
+    heights, nesting = {}, {}
+    for node in reversed(order):
+        height = nested = 0
+        for child in node.children:
+            if isinstance(child, Tree):
+                if heights[id(child)] > height: height = heights[id(child)]
+                if nesting[id(child)] > nested: nested = nesting[id(child)]
+        heights[id(node)] = height + 1
+        nesting[id(node)] = nested + (node.data == "program")
+    stack = [tree] if heights[id(tree)] > deep or nesting[id(tree)] > blocks else []
+    while stack:
+        node = stack.pop()
+        for i, child in enumerate(node.children):
+            if not isinstance(child, Tree):
+                continue
+            # nodes made here (linear, branch, jump) are looked through
+            if child.data in ("if_stmt", "while_stmt") and nesting[id(child)] > blocks:
+                node.children[i] = linear(child)
+                stack.append(node.children[i])
+            elif heights.get(id(child), deep + 1) <= deep and nesting.get(id(child), blocks + 1) <= blocks:
+                continue
+            elif child.data in FLATTENED and heights[id(child)] > deep:
+                node.children[i] = postfix(child)
+            else:
+                stack.append(child)
+    return tree
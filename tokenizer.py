@@ -0,0 +1,54 @@
+# **** PlayCode tokenizer ****
+
+# hand-written scanner for pc.lark, one master regex instead of lark's generic
+# lexer, tokens are (type, value, position) tuples where type is the lark
+# terminal name (CNAME, SIGNED_NUMBER, STRING, TAG) or the literal text
+
+import re
+
+KEYWORDS = {"swap", "if", "else", "while", "print", "True", "False"}
+
+# tokens after which + or - is an operator rather than the sign of a number
+OPERAND_END = {"CNAME", "SIGNED_NUMBER", "True", "False", ")", "]"}
+
+TOKEN = re.compile(r"""
+    (?P<WS>\s+)
+  | (?P<COMMENT>--[^\n]*)
+  | (?P<ARROW>->)
+  | (?P<STRING>"[^"\\\n]*(?:\\.[^"\\\n]*)*")
+  | (?P<TAG>@[a-zA-Z_]+)
+  | (?P<SIGNED_NUMBER>[+-]?(?:[0-9]+\.[0-9]*|\.[0-9]+|[0-9]+)(?:[eE][+-]?[0-9]+)?)
+  | (?P<CNAME>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<OP>==|!=|[-+*/<>=(){}\[\],])
+""", re.VERBOSE)
+
+def tokenize(source):
+    tokens = []
+    append = tokens.append
+    previous = None
+    current_char_index = 0
+    match_token = TOKEN.match
+    while current_char_index < len(source):
+        match = match_token(source, current_char_index)
+        if match is None:
+            raise SyntaxError(f"Unknown character: {source[current_char_index]!r} at line {line(source, current_char_index)}")
+        kind, value = match.lastgroup, match.group()
+        current_char_index = match.end()
+        match kind:
+            case "WS" | "COMMENT":
+                continue
+            case "CNAME":
+                if value in KEYWORDS: kind = value
+            case "SIGNED_NUMBER":
+                # x-1 is a subtraction, only a leading sign after an operand is an operator
+                if value[0] in "+-" and previous in OPERAND_END:
+                    append((value[0], value[0], match.start()))
+                    value = value[1:]
+            case "ARROW" | "OP":
+                kind = value
+        append((kind, value, match.start()))
+        previous = kind
+    return tokens
+
+def line(source, position):
+    return source.count("\n", 0, position) + 1
@@ -0,0 +1,171 @@
+# **** PlayCode vectors ****
+
+# vector values shared by the engines, vectors of ints are packed into a typed
+# buffer (Vector, an array('q') that prints like a list), anything else stays a
+# list, whole-vector operations work on both:
+#   x + y, x - 1, 2 * x, x / y   elementwise, operands go through int() like scalars
+#   sum(x), min(x), max(x), len(x)
+# BACKEND = "numpy" packs into int64 numpy arrays instead, arithmetic and sums
+# that may leave 64 bits are done on python ints so nothing wraps, "list" keeps
+# every vector a list
+
+import operator
+from array import array
+from itertools import repeat
+
+BACKEND = "array"
+BACKENDS = ("array", "numpy", "list")
+
+OPERATORS = {"add": operator.add, "sub": operator.sub, "mul": operator.mul, "div": operator.truediv}
+
+REDUCTIONS = ("sum", "min", "max", "len")
+
+class Vector(array):
+    def __repr__(self):
+        return repr(self.tolist())
+
+    # int() would read the buffer, engines take TypeError as a vector operand
+    def __int__(self):
+        raise TypeError("vector is not a number")
+
+# typed vector types, numpy's is added on first use
+TYPED = (Vector,)
+VECTORS = (list, Vector)
+
+_numpy = None
+
+def numpy():
+    global _numpy, TYPED, VECTORS
+    if _numpy is None:
+        import numpy as np
+
+        class NumpyVector(np.ndarray):
+            def __repr__(self):
+                return repr(self.tolist())
+
+            def __str__(self):
+                return repr(self.tolist())
+
+            # a one element array would convert
+            def __int__(self):
+                raise TypeError("vector is not a number")
+
+            # elements come out as python ints, like from a list or array
+            def __getitem__(self, index):
+                return np.ndarray.__getitem__(self, index).item()
+
+        _numpy = (np, NumpyVector)
+        TYPED = (Vector, NumpyVector)
+        VECTORS = (list, Vector, NumpyVector)
+    return _numpy
+
+# sets BACKEND, ValueError for an unknown one and ImportError when numpy is not installed
+def select(backend):
+    global BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if backend == "numpy":
+        numpy()
+    BACKEND = backend
+
+# largest magnitude of an int or the elements of a vector, as a python int
+def magnitude(value):
+    if type(value) is int:
+        return abs(value)
+    if len(value) == 0:
+        return 0
+    if type(value) in (list, Vector):
+        return max(-min(value), max(value))
+    return max(-value.min().item(), value.max().item())
+
+# a typed vector for a list of python ints, OverflowError if one does not fit in 64 bits
+def typed(values):
+    if BACKEND == "numpy":
+        np, NumpyVector = numpy()
+        return np.array(values, dtype=np.int64).view(NumpyVector)
+    return Vector("q", values)
+
+def vector(values):
+    if BACKEND != "list" and values and all(type(value) is int for value in values):
+        try:
+            return typed(values)
+        except OverflowError:
+            pass
+    return values
+
+# elements as ints, the int() every arithmetic operand goes through
+def ints(value):
+    if type(value) in TYPED:
+        return value
+    return [int(item) for item in value]
+
+# elementwise + - * /, called by the engines when int() of an operand fails
+def binary(op, left, right):
+    left_vector, right_vector = isinstance(left, VECTORS), isinstance(right, VECTORS)
+    if op not in OPERATORS or not (left_vector or right_vector):
+        raise TypeError(f"unsupported operands for {op}: {type(left).__name__} and {type(right).__name__}")
+    if left_vector and right_vector and len(left) != len(right):
+        raise ValueError(f"vector lengths differ: {len(left)} and {len(right)}")
+    a = ints(left) if left_vector else int(left)
+    b = ints(right) if right_vector else int(right)
+    if BACKEND == "numpy":
+        np, NumpyVector = numpy()
+        # numpy wraps at 64 bits, operands or results that may not fit are left to python ints
+        x, y = magnitude(a), magnitude(b)
+        if max(x, y, x * y if op == "mul" else x + y if op != "div" else 0) < 2**63:
+            if left_vector: a = np.asarray(a, dtype=np.int64)
+            if right_vector: b = np.asarray(b, dtype=np.int64)
+            if op == "div":
+                if np.any(np.asarray(b) == 0):
+                    raise ZeroDivisionError("division by zero")
+                return np.asarray(OPERATORS[op](a, b)).tolist()
+            return np.asarray(OPERATORS[op](a, b)).view(NumpyVector)
+        if left_vector: a = list(map(int, a))
+        if right_vector: b = list(map(int, b))
+    values = list(map(OPERATORS[op], a if left_vector else repeat(a), b if right_vector else repeat(b)))
+    # division gives floats, which stay a list
+    return vector(values) if op != "div" else values
+
+def reduce(name, value):
+    if name not in REDUCTIONS:
+        raise NameError(f"Unknown reduction: {name}")
+    if not isinstance(value, VECTORS):
+        raise TypeError(f"{name} expects a vector, got {type(value).__name__}")
+    if name == "len":
+        return len(value)
+    value = ints(value)
+    if BACKEND == "numpy" and len(value) > 0:
+        np, NumpyVector = numpy()
+        # a sum numpy could wrap is left to python ints
+        if magnitude(value) * (len(value) if name == "sum" else 1) < 2**63:
+            return getattr(np.asarray(value, dtype=np.int64), name)().item()
+        value = list(map(int, value))
+    return {"sum": sum, "min": min, "max": max}[name](value)
+
+# value[index] = item for any vector, a typed vector that cannot hold item (not an
+# int, or too big) becomes a list, every reference to it in `tables` (dicts or
+# lists of variables) is moved over so aliases still share it
+def store(value, index, item, tables):
+    if type(value) not in TYPED:
+        value[index] = item
+        return
+    if type(item) is int:
+        try:
+            value[index] = item
+            return
+        except OverflowError:
+            pass
+    widened = value.tolist()
+    widened[index] = item
+    replace(value, widened, tables, set())
+
+def replace(old, new, containers, seen):
+    for container in containers:
+        if id(container) in seen:
+            continue
+        seen.add(id(container))
+        for key, value in (container.items() if isinstance(container, dict) else enumerate(container)):
+            if value is old:
+                container[key] = new
+            elif type(value) is list:
+                replace(old, new, (value,), seen)
@@ -0,0 +1,462 @@
+# **** PlayCode bytecode compiler and register VM ****
+
+# instructions are four ints (op, a, b, c) packed into one array('i'), registers
+# are laid out as [variables][constants][temporaries] so constants never need
+# loading, and jump operands are offsets into the code array, variables start
+# out None (unset), and a read that may find one unset is preceded by a CHECK
+
+from array import array
+
+import resolve
+import syntax
+import vectors
+
+(HALT, MOVE, ADD, SUB, MUL, DIV, EQ, NEQ, LT, GT, BLT, BGT, BLE, BGE, BEQ, BNE,
+ JMP, JMPF, JMPT, GETI, SETI, VEC, SWAP, PRINT, PRINTA, ASSERT, TAGDEF, CALL, RET, REDUCE, TICK, CHECK, INT) = range(33)
+
+OPNAMES = ["HALT", "MOVE", "ADD", "SUB", "MUL", "DIV", "EQ", "NEQ", "LT", "GT", "BLT", "BGT", "BLE", "BGE", "BEQ", "BNE",
+           "JMP", "JMPF", "JMPT", "GETI", "SETI", "VEC", "SWAP", "PRINT", "PRINTA", "ASSERT", "TAGDEF", "CALL", "RET", "REDUCE", "TICK", "CHECK", "INT"]
+
+# operand kinds for the disassembler: r = register, j = jump offset, s = string pool, n = count
+OPERANDS = {
+    HALT: "", MOVE: "rr", ADD: "rrr", SUB: "rrr", MUL: "rrr", DIV: "rrr", EQ: "rrr", NEQ: "rrr", LT: "rrr", GT: "rrr",
+    BLT: "rrj", BGT: "rrj", BLE: "rrj", BGE: "rrj", BEQ: "rrj", BNE: "rrj", JMP: "j", JMPF: "rj", JMPT: "rj",
+    GETI: "rrr", SETI: "rrr", VEC: "rrn", SWAP: "rr", PRINT: "r", PRINTA: "rs", ASSERT: "rs", TAGDEF: "sj", CALL: "s", RET: "",
+    REDUCE: "rrs", TICK: "j", CHECK: "rs", INT: "rr",
+}
+
+# operand position of the target of every jump
+TARGETS = {BLT: 3, BGT: 3, BLE: 3, BGE: 3, BEQ: 3, BNE: 3, JMP: 1, JMPF: 2, JMPT: 2, TAGDEF: 2}
+
+BINARY = {"add": ADD, "sub": SUB, "mul": MUL, "div": DIV, "eq": EQ, "neq": NEQ, "lt": LT, "gt": GT}
+ARITHMETIC = {ADD: "add", SUB: "sub", MUL: "mul", DIV: "div"}
+# compare-and-branch taken when the comparison is true, and when it is false
+BRANCH_TRUE = {"lt": BLT, "gt": BGT, "eq": BEQ, "neq": BNE}
+BRANCH_FALSE = {"lt": BGE, "gt": BLE, "eq": BNE, "neq": BEQ}
+
+class Program(object):
+    def __init__(self, code, consts, strings, names, ntemps):
+        self.code = code
+        self.consts = consts
+        self.strings = strings
+        self.names = names
+        self.ntemps = ntemps
+
+    def registers(self):
+        return [None] * len(self.names) + list(self.consts) + [None] * self.ntemps
+
+# constant pool key of a number literal
+def number(node):
+    value = node.children[0]
+    return (int, value) if type(value) is int else (str, str(value))
+
+def compile_program(tree):
+    # expressions too deep to compile by recursion become postfix nodes
+    tree = syntax.flatten(tree)
+    names, consts, strings = resolve.resolve(tree), {}, {}
+    unset = resolve.unset(tree)
+    code = array("i")
+    top = maxtop = 0
+
+    # first pass: variables take their resolved slots as registers, then every
+    # literal gets one, one int() rejects (1.5) is kept as its text for an INT to fail on
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        match node.data:
+            case "number":
+                consts.setdefault(number(node), len(consts))
+            case "true":
+                consts.setdefault((bool, True), len(consts))
+            case "false":
+                consts.setdefault((bool, False), len(consts))
+        stack.extend(child for child in reversed(node.children) if isinstance(child, syntax.Tree))
+    base = len(names) + len(consts)
+
+    def emit(op, a=0, b=0, c=0):
+        code.extend((op, a, b, c))
+        return len(code) - 4
+
+    def patch(at, offset):
+        code[at + 1 + OPERANDS[code[at]].index("j")] = offset
+
+    def string(value):
+        return strings.setdefault(value, len(strings))
+
+    def alloc(n=1):
+        nonlocal top, maxtop
+        reg = base + top
+        top += n
+        maxtop = max(maxtop, top)
+        return reg
+
+    # register of the variable an identifier node (or element step) reads, checked if it may be unset
+    def load(node):
+        reg = names[str(node.children[0])]
+        if id(node) in unset: emit(CHECK, reg, string(str(node.children[0])))
+        return reg
+
+    # a comparison puts its left operand through int() before the right one is
+    # evaluated, as the walker does, left out when the right one cannot fail
+    def ordered(reg, right):
+        match right.data:
+            case "true" | "false":
+                return reg
+            case "number" if type(right.children[0]) is int:
+                return reg
+            case "identifier" if id(right) not in unset:
+                return reg
+        dst = reg if reg >= base else alloc()
+        emit(INT, dst, reg)
+        return dst
+
+    def into(reg, target):
+        if target is None or target == reg: return reg
+        emit(MOVE, target, reg)
+        return target
+
+    def expr(node, target=None):
+        nonlocal top
+        match node.data:
+            case "number":
+                reg = len(names) + consts[number(node)]
+                if type(node.children[0]) is int: return into(reg, target)
+                dst = target if target is not None else alloc()
+                emit(INT, dst, reg)
+                return dst
+            case "true":
+                return into(len(names) + consts[(bool, True)], target)
+            case "false":
+                return into(len(names) + consts[(bool, False)], target)
+            case "identifier":
+                reg = load(node)
+                if len(node.children) == 1: return into(reg, target)
+                mark = top
+                index = expr(node.children[1])
+                top = mark
+                dst = target if target is not None else alloc()
+                emit(GETI, dst, reg, index)
+                return dst
+            case "vector":
+                mark = top
+                first = alloc(len(node.children))
+                for i, child in enumerate(node.children): expr(child, first + i)
+                top = mark
+                dst = target if target is not None else alloc()
+                emit(VEC, dst, first, len(node.children))
+                return dst
+            case "reduction":
+                mark = top
+                value = expr(node.children[1])
+                top = mark
+                dst = target if target is not None else alloc()
+                emit(REDUCE, dst, value, string(str(node.children[0])))
+                return dst
+            case op if op in BINARY:
+                mark = top
+                left = expr(node.children[0])
+                if op in syntax.COMPARISONS: left = ordered(left, node.children[1])
+                right = expr(node.children[1])
+                top = mark
+                dst = target if target is not None else alloc()
+                emit(BINARY[op], dst, left, right)
+                return dst
+            case "postfix":
+                # operands as (register, top before it), an operator frees its operands' temporaries
+                operands = []
+                for step in node.children:
+                    match step.data:
+                        case "int":
+                            operand, mark = operands.pop()
+                            dst = operand if operand >= base else alloc()
+                            emit(INT, dst, operand)
+                        case "element" | "reduction":
+                            operand, mark = operands.pop()
+                            top = mark
+                            dst = alloc()
+                            if step.data == "element": emit(GETI, dst, load(step), operand)
+                            else: emit(REDUCE, dst, operand, string(str(step.children[0])))
+                        case op if op in BINARY:
+                            right, _ = operands.pop()
+                            left, mark = operands.pop()
+                            top = mark
+                            dst = alloc()
+                            emit(BINARY[op], dst, left, right)
+                        case _:
+                            mark = top
+                            dst = expr(step)
+                    operands.append((dst, mark))
+                return into(operands[0][0], target)
+        raise SyntaxError(f"Unknown node: {node.data}")
+
+    # conditional jump to a not yet known offset, returns instruction to patch
+    def branch(node, when):
+        nonlocal top
+        mark = top
+        if node.data in BRANCH_TRUE:
+            left = ordered(expr(node.children[0]), node.children[1])
+            right = expr(node.children[1])
+            top = mark
+            return emit((BRANCH_TRUE if when else BRANCH_FALSE)[node.data], left, right)
+        reg = expr(node)
+        top = mark
+        return emit(JMPT if when else JMPF, reg)
+
+    def stmt(node):
+        nonlocal top
+        mark = top
+        match node.data:
+            case "program":
+                for child in node.children: stmt(child)
+            case "taggable":
+                if len(node.children) > 1:
+                    emit(TAGDEF, string(node.children[0].value), len(code) + 8)
+                    skip = emit(JMP)
+                    stmt(node.children[1])
+                    emit(RET)
+                    patch(skip, len(code))
+                else:
+                    stmt(node.children[0])
+            case "assign_stmt":
+                left, right = node.children
+                reg = load(left) if len(left.children) > 1 else names[str(left.children[0])]
+                if len(left.children) > 1:
+                    index = expr(left.children[1])
+                    emit(SETI, reg, index, expr(right))
+                else:
+                    expr(right, reg)
+            case "tag_stmt":
+                emit(CALL, string(node.children[0].value))
+            case "swap_stmt":
+                left, right = node.children
+                a, b = load(left), load(right)
+                if len(left.children) == 1 and len(right.children) == 1:
+                    emit(SWAP, a, b)
+                else:
+                    # load both sides into temporaries, then store crosswise, the right
+                    # index evaluated again after the left store, as in the walker
+                    i = expr(left.children[1]) if len(left.children) > 1 else None
+                    j = expr(right.children[1]) if len(right.children) > 1 else None
+                    x, y = alloc(), alloc()
+                    if i is None: emit(MOVE, x, a)
+                    else: emit(GETI, x, a, i)
+                    if j is None: emit(MOVE, y, b)
+                    else: emit(GETI, y, b, j)
+                    if i is None: emit(MOVE, a, y)
+                    else: emit(SETI, a, i, y)
+                    if j is None: emit(MOVE, b, x)
+                    else: emit(SETI, b, expr(right.children[1]), x)
+            case "if_stmt":
+                otherwise = branch(node.children[0], False)
+                if len(node.children) > 1: stmt(node.children[1])
+                if len(node.children) > 2:
+                    end = emit(JMP)
+                    patch(otherwise, len(code))
+                    stmt(node.children[2])
+                    patch(end, len(code))
+                else:
+                    patch(otherwise, len(code))
+            case "while_stmt":
+                # condition at the bottom so each iteration takes a single branch
+                test = emit(JMP)
+                body = len(code)
+                if len(node.children) > 1: stmt(node.children[1])
+                patch(test, len(code))
+                patch(branch(node.children[0], True), body)
+            case "assert_stmt":
+                emit(ASSERT, expr(node.children[0]), string(node.children[1].children[0]))
+            case "print_stmt":
+                reg = expr(node.children[0])
+                if len(node.children) > 1 and node.children[1].data == "assert":
+                    emit(PRINTA, reg, string(node.children[1].children[0]))
+                else:
+                    emit(PRINT, reg)
+            case "linear":
+                # blocks taken apart by syntax.flatten, jumps go to the offset of a step once all are placed
+                starts, jumps = [], []
+                for step in node.children:
+                    starts.append(len(code))
+                    match step.data:
+                        case "branch": jumps.append((branch(step.children[0], False), step.children[1]))
+                        case "jump": jumps.append((emit(JMP), step.children[0]))
+                        case _: stmt(step)
+                starts.append(len(code))
+                for at, target in jumps: patch(at, starts[target])
+            case _:
+                raise SyntaxError(f"Unknown node: {node.data}")
+        top = mark
+
+    stmt(tree)
+    emit(HALT)
+    return Program(code, [value for (kind, value) in consts], list(strings), list(names), maxtop)
+
+# with a budget, back edges and tag entries are sent through a TICK (counting a
+# step, then jumping on) appended to the running copy of the code, so neither
+# the cached bytecode nor a run without a budget ever sees one
+def budgeted(code):
+    for pc in range(0, len(code), 4):
+        slot = TARGETS.get(code[pc])
+        if slot is not None and (code[pc] == TAGDEF or code[pc + slot] <= pc):
+            code.extend((TICK, code[pc + slot], 0, 0))
+            code[pc + slot] = len(code) - 4
+    return code
+
+def run(program, SYMBOL_TABLE, TAG_TABLE, STDOUT, STDERR, budget=None):
+    # the packed array is the stored form, a list is faster to index while running
+    code, strings = program.code.tolist(), program.strings
+    if budget is not None: code = budgeted(code)
+    R = program.registers()
+    try:
+        execute(code, strings, R, TAG_TABLE, STDOUT, STDERR, budget)
+    finally:
+        # rebuild the name -> value view for --tables, also of a program stopped part way
+        SYMBOL_TABLE.update(resolve.tables(dict(zip(program.names, range(len(program.names)))), R))
+
+def execute(code, strings, R, TAG_TABLE, STDOUT, STDERR, budget):
+    calls = []
+    pc = 0
+    # arithmetic on a vector operand fails in int() and an int too big for a typed
+    # vector overflows, the failed instruction is redone on the slow path
+    while True:
+        try:
+            while True:
+                op = code[pc]
+                if op == GETI:
+                    R[code[pc + 1]] = R[code[pc + 2]][int(R[code[pc + 3]])]
+                elif op == BLT:
+                    if int(R[code[pc + 1]]) < int(R[code[pc + 2]]):
+                        pc = code[pc + 3]
+                        continue
+                elif op == BLE:
+                    if int(R[code[pc + 1]]) <= int(R[code[pc + 2]]):
+                        pc = code[pc + 3]
+                        continue
+                elif op == ADD:
+                    R[code[pc + 1]] = int(R[code[pc + 2]]) + int(R[code[pc + 3]])
+                elif op == SUB:
+                    R[code[pc + 1]] = int(R[code[pc + 2]]) - int(R[code[pc + 3]])
+                elif op == SETI:
+                    # only ints go straight into a typed vector, anything else may widen it to a list
+                    vector, item = R[code[pc + 1]], R[code[pc + 3]]
+                    if type(item) is int or type(vector) is list:
+                        vector[R[code[pc + 2]]] = item
+                    else:
+                        vectors.store(vector, R[code[pc + 2]], item, (R,))
+                elif op == MOVE:
+                    R[code[pc + 1]] = R[code[pc + 2]]
+                elif op == BGE:
+                    if int(R[code[pc + 1]]) >= int(R[code[pc + 2]]):
+                        pc = code[pc + 3]
+                        continue
+                elif op == BGT:
+                    if int(R[code[pc + 1]]) > int(R[code[pc + 2]]):
+                        pc = code[pc + 3]
+                        continue
+                elif op == BEQ:
+                    if int(R[code[pc + 1]]) == int(R[code[pc + 2]]):
+                        pc = code[pc + 3]
+                        continue
+                elif op == BNE:
+                    if int(R[code[pc + 1]]) != int(R[code[pc + 2]]):
+                        pc = code[pc + 3]
+                        continue
+                elif op == JMP:
+                    pc = code[pc + 1]
+                    continue
+                elif op == TICK:
+                    budget.left -= 1
+                    if budget.left < 0: budget.refill()
+                    pc = code[pc + 1]
+                    continue
+                elif op == JMPF:
+                    if not R[code[pc + 1]]:
+                        pc = code[pc + 2]
+                        continue
+                elif op == JMPT:
+                    if R[code[pc + 1]]:
+                        pc = code[pc + 2]
+                        continue
+                elif op == MUL:
+                    R[code[pc + 1]] = int(R[code[pc + 2]]) * int(R[code[pc + 3]])
+                elif op == DIV:
+                    R[code[pc + 1]] = int(R[code[pc + 2]]) / int(R[code[pc + 3]])
+                elif op == EQ:
+                    R[code[pc + 1]] = int(R[code[pc + 2]]) == int(R[code[pc + 3]])
+                elif op == NEQ:
+                    R[code[pc + 1]] = int(R[code[pc + 2]]) != int(R[code[pc + 3]])
+                elif op == LT:
+                    R[code[pc + 1]] = int(R[code[pc + 2]]) < int(R[code[pc + 3]])
+                elif op == GT:
+                    R[code[pc + 1]] = int(R[code[pc + 2]]) > int(R[code[pc + 3]])
+                elif op == SWAP:
+                    a, b = code[pc + 1], code[pc + 2]
+                    R[a], R[b] = R[b], R[a]
+                elif op == CALL:
+                    calls.append(pc + 4)
+                    pc = TAG_TABLE[strings[code[pc + 1]]]
+                    continue
+                elif op == RET:
+                    pc = calls.pop()
+                    continue
+                elif op == TAGDEF:
+                    TAG_TABLE[strings[code[pc + 1]]] = code[pc + 2]
+                elif op == VEC:
+                    first = code[pc + 2]
+                    R[code[pc + 1]] = vectors.vector(R[first:first + code[pc + 3]])
+                elif op == PRINT:
+                    STDOUT.append(str(R[code[pc + 1]]))
+                elif op == PRINTA or op == ASSERT:
+                    output, expected = str(R[code[pc + 1]]), strings[code[pc + 2]]
+                    if not output == expected:
+                        STDERR.append(f"Assert error: {output} not equal to {expected}")
+                    if op == PRINTA: STDOUT.append(output)
+                elif op == REDUCE:
+                    R[code[pc + 1]] = vectors.reduce(strings[code[pc + 3]], R[code[pc + 2]])
+                elif op == INT:
+                    R[code[pc + 1]] = int(R[code[pc + 2]])
+                elif op == CHECK:
+                    if R[code[pc + 1]] is None: raise KeyError(strings[code[pc + 2]])
+                elif op == HALT:
+                    break
+                pc += 4
+        except (TypeError, OverflowError):
+            op = code[pc]
+            if op in ARITHMETIC and (isinstance(R[code[pc + 2]], vectors.VECTORS) or isinstance(R[code[pc + 3]], vectors.VECTORS)):
+                R[code[pc + 1]] = vectors.binary(ARITHMETIC[op], R[code[pc + 2]], R[code[pc + 3]])
+            elif op == SETI:
+                vectors.store(R[code[pc + 1]], R[code[pc + 2]], R[code[pc + 3]], (R,))
+            else:
+                raise
+            pc += 4
+            continue
+        break
+
+# marshal friendly form for the on-disk cache
+def dump(program):
+    return (program.code.tobytes(), program.consts, program.strings, program.names, program.ntemps)
+
+def load(data):
+    code = array("i")
+    code.frombytes(data[0])
+    return Program(code, *data[1:])
+
+def disassemble(program):
+    nvars, nconsts = len(program.names), len(program.consts)
+    def register(reg):
+        if reg < nvars: return program.names[reg]
+        if reg < nvars + nconsts: return f"#{program.consts[reg - nvars]}"
+        return f"t{reg - nvars - nconsts}"
+    lines = []
+    for pc in range(0, len(program.code), 4):
+        op = program.code[pc]
+        operands = []
+        for kind, value in zip(OPERANDS[op], program.code[pc + 1:pc + 4]):
+            match kind:
+                case "r": operands.append(register(value))
+                case "j": operands.append(f"-> {value:04d}")
+                case "s": operands.append(repr(program.strings[value]))
+                case "n": operands.append(str(value))
+        lines.append(f"{pc:04d}  {OPNAMES[op]:<7} {', '.join(operands)}")
+    lines.append(f"; {len(program.code) // 4} instructions, {len(program.code) * program.code.itemsize} bytes, "
+                 f"{nvars} variables, {nconsts} constants, {program.ntemps} temporaries")
+    return "\n".join(lines)